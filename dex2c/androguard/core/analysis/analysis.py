@@ -1,5 +1,8 @@
+import hashlib
 import re
 import warnings
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from androguard.core.bytecodes import dvm
 import logging
 
@@ -9,6 +12,17 @@ BasicOPCODES = []
 for i in dvm.BRANCH_DVM_OPCODES:
     BasicOPCODES.append(re.compile(i))
 
+# Op values of the instructions which end a basic block, i.e. the ones whose
+# name matches BasicOPCODES
+BRANCH_OP_VALUES = frozenset(
+    op_value
+    for table in (dvm.DALVIK_OPCODES_FORMAT,
+                  dvm.DALVIK_OPCODES_EXTENDED_WIDTH,
+                  dvm.DALVIK_OPCODES_OPTIMIZED)
+    for op_value, (_, desc) in table.items()
+    if any(j.match(desc[0]) is not None for j in BasicOPCODES)
+)
+
 
 class DVMBasicBlock:
     """
@@ -34,20 +48,19 @@ class DVMBasicBlock:
         self.name = "%s-BB@0x%x" % (self.method.get_name(), self.start)
         self.exception_analysis = None
 
-        self.__cached_instructions = None
-
     def get_instructions(self):
         """
         Get all instructions from a basic block.
 
         :rtype: Return all instructions in the current basic block
         """
-        tmp_ins = []
-        idx = 0
-        for i in self.method.get_instructions():
-            if self.start <= idx < self.end:
-                yield i
-            idx += i.get_length()
+        # The instructions of the block are consecutive in the cached
+        # instructions of the method
+        code = self.method.get_code().get_bc()
+        first = code.off_to_pos(self.start)
+        if first < 0:
+            return []
+        return code.cached_instructions[first:first + self.nb_instructions]
 
     def get_nb_instructions(self):
         return self.nb_instructions
@@ -144,16 +157,25 @@ class BasicBlocks:
     def __init__(self, _vm):
         self.__vm = _vm
         self.bb = []
+        # start of the basic blocks, in the same order as self.bb
+        self.__starts = None
 
     def push(self, bb):
         self.bb.append(bb)
+        self.__starts = None
 
     def pop(self, idx):
+        self.__starts = None
         return self.bb.pop(idx)
 
     def get_basic_block(self, idx):
-        for i in self.bb:
-            if i.get_start() <= idx < i.get_end():
+        # The basic blocks are pushed in the order of the instructions
+        if self.__starts is None:
+            self.__starts = [i.get_start() for i in self.bb]
+        pos = bisect_right(self.__starts, idx) - 1
+        if pos >= 0:
+            i = self.bb[pos]
+            if idx < i.get_end():
                 return i
         return None
 
@@ -208,19 +230,65 @@ class Exceptions:
     def __init__(self, _vm):
         self.__vm = _vm
         self.exceptions = []
+        self.__index = None
 
     def add(self, exceptions, basic_blocks):
         for i in exceptions:
             self.exceptions.append(ExceptionAnalysis(i, basic_blocks))
+        self.__index = None
+
+    def __build_index(self):
+        # Positions in self.exceptions sorted by start address
+        by_start = sorted(range(len(self.exceptions)),
+                          key=lambda pos: self.exceptions[pos].start)
+        starts = [self.exceptions[pos].start for pos in by_start]
+
+        # The [start, end] ranges split the addresses in segments, each one
+        # covered by the same ranges
+        bounds = sorted({i.start for i in self.exceptions} |
+                        {i.end + 1 for i in self.exceptions})
+        covering = [[] for _ in bounds]
+        for pos, i in enumerate(self.exceptions):
+            for segment in range(bisect_left(bounds, i.start),
+                                 bisect_left(bounds, i.end + 1)):
+                covering[segment].append(pos)
+
+        self.__index = (by_start, starts, bounds, covering)
 
     def get_exception(self, addr_start, addr_end):
-        for i in self.exceptions:
-            if i.start >= addr_start and i.end <= addr_end:
-                return i
+        """
+        Return the first exception whose range is inside
+        [addr_start, addr_end], or contains it.
 
-            elif addr_end <= i.end and addr_start >= i.start:
-                return i
+        :rtype: None or an :class:`ExceptionAnalysis`
+        """
+        if not self.exceptions:
+            return None
+        if self.__index is None:
+            self.__build_index()
+        by_start, starts, bounds, covering = self.__index
+
+        found = len(self.exceptions)
+
+        # ranges inside [addr_start, addr_end]
+        for k in range(bisect_left(starts, addr_start),
+                       bisect_right(starts, addr_end)):
+            pos = by_start[k]
+            if pos < found and self.exceptions[pos].end <= addr_end:
+                found = pos
+
+        # ranges containing [addr_start, addr_end] also contain addr_start
+        segment = bisect_right(bounds, addr_start) - 1
+        if segment >= 0:
+            for pos in covering[segment]:
+                if pos >= found:
+                    break
+                if self.exceptions[pos].end >= addr_end:
+                    found = pos
+                    break
 
+        if found < len(self.exceptions):
+            return self.exceptions[found]
         return None
 
     def gets(self):
@@ -256,33 +324,32 @@ class MethodAnalysis:
         self.basic_blocks.push(current_basic)
 
         bc = self.code.get_bc()
-        l = []
+        # offsets of the first instruction of the blocks
+        leaders = set()
         h = {}
         idx = 0
 
         log.debug("Parsing instructions")
         for i in bc.get_instructions():
-            for j in BasicOPCODES:
-                if j.match(i.get_name()) is not None:
-                    v = dvm.determineNext(i, idx, self.method)
-                    h[idx] = v
-                    l.extend(v)
-                    break
+            if i.get_op_value() in BRANCH_OP_VALUES:
+                v = dvm.determineNext(i, idx, self.method)
+                h[idx] = v
+                leaders.update(v)
 
             idx += i.get_length()
 
         log.debug("Parsing exceptions")
         excepts = dvm.determineException(self.__vm, self.method)
         for i in excepts:
-            l.extend([i[0]])
+            leaders.add(i[0])
             for handler in i[2:]:
-                l.append(handler[1])
+                leaders.add(handler[1])
 
         log.debug("Creating basic blocks in %s" % self.method)
         idx = 0
         for i in bc.get_instructions():
             # index is a destination
-            if idx in l:
+            if idx in leaders:
                 if current_basic.get_nb_instructions() != 0:
                     current_basic = DVMBasicBlock(current_basic.get_end(), self.__vm, self.method, self.basic_blocks)
                     self.basic_blocks.push(current_basic)
@@ -425,8 +492,154 @@ class ClassAnalysis:
         return self.orig_class
 
 
+JAVA_LANG_OBJECT = 'Ljava/lang/Object;'
+
+
+class ClassHierarchy:
+    def __init__(self, classes):
+        """
+        Superclasses and interfaces of the classes of all the
+        DalvikVMFormat objects of an :class:`Analysis`.
+
+        The classes which are not defined in the dex files, like the ones of
+        the framework, are known by name only: their superclass is unknown.
+        The supertypes and the common superclasses are computed on demand
+        and cached.
+
+        :param classes: iterable of :class:`ClassAnalysis`
+        """
+        # A dict of {classname: superclass name}
+        self.__superclass = {}
+        # A dict of {classname: list of interface names}
+        self.__interfaces = {}
+        self.__supertypes = {}
+        self.__common_superclasses = {}
+
+        for current_class in classes:
+            vm_class = current_class.get_vm_class()
+            name = vm_class.get_name()
+            superclass = vm_class.get_superclassname()
+            if name != JAVA_LANG_OBJECT and superclass and superclass[0] == 'L':
+                self.__superclass[name] = superclass
+            self.__interfaces[name] = list(vm_class.get_interfaces())
+
+    def is_known_class(self, name):
+        """
+        Return True if the class is defined in one of the dex files
+
+        :param str name: class descriptor
+        """
+        return name in self.__interfaces
+
+    def get_superclass(self, name):
+        """
+        Return the superclass of a class, None for java.lang.Object and
+        for the classes which are not defined in the dex files
+
+        :param str name: class descriptor
+        """
+        return self.__superclass.get(name)
+
+    def get_superclasses(self, name):
+        """
+        Return the list of the known superclasses of a class, starting with
+        the class itself
+
+        :param str name: class descriptor
+        """
+        chain = [name]
+        seen = {name}
+        superclass = self.__superclass.get(name)
+        # A cycle can only come from a broken dex file
+        while superclass is not None and superclass not in seen:
+            chain.append(superclass)
+            seen.add(superclass)
+            superclass = self.__superclass.get(superclass)
+        return chain
+
+    def get_supertypes(self, name):
+        """
+        Return the set of the known superclasses and interfaces of a class,
+        the class itself included
+
+        :param str name: class descriptor
+        :rtype: frozenset
+        """
+        supertypes = self.__supertypes.get(name)
+        if supertypes is not None:
+            return supertypes
+
+        found = set()
+        todo = [name]
+        while todo:
+            current = todo.pop()
+            if current in found:
+                continue
+            found.add(current)
+            superclass = self.__superclass.get(current)
+            if superclass is not None:
+                todo.append(superclass)
+            todo.extend(self.__interfaces.get(current, ()))
+        supertypes = self.__supertypes[name] = frozenset(found)
+        return supertypes
+
+    def is_subtype(self, name, supertype):
+        """
+        Return True if the class `name` is known to be assignable to
+        `supertype`
+
+        :param str name: class descriptor
+        :param str supertype: class descriptor
+        """
+        return supertype == JAVA_LANG_OBJECT or supertype in self.get_supertypes(name)
+
+    def get_common_superclass(self, name1, name2):
+        """
+        Return the most precise known type both classes are assignable to:
+        one of them if it is a supertype of the other one, else their nearest
+        common superclass, else java.lang.Object.
+
+        :param str name1: class descriptor
+        :param str name2: class descriptor
+        """
+        key = (name1, name2)
+        common = self.__common_superclasses.get(key)
+        if common is not None:
+            return common
+
+        if self.is_subtype(name1, name2):
+            common = name2
+        elif self.is_subtype(name2, name1):
+            common = name1
+        else:
+            common = JAVA_LANG_OBJECT
+            superclasses2 = set(self.get_superclasses(name2))
+            for superclass in self.get_superclasses(name1):
+                if superclass in superclasses2:
+                    common = superclass
+                    break
+        self.__common_superclasses[key] = common
+        return common
+
+    def get_digest(self, names):
+        """
+        Return a digest of the part of the hierarchy above the classes
+        `names`, which changes whenever the superclass or the interfaces of
+        one of them or of one of their supertypes change
+
+        :param names: iterable of class descriptors
+        """
+        supertypes = set()
+        for name in names:
+            supertypes.update(self.get_supertypes(name))
+        sha = hashlib.sha256()
+        for name in sorted(supertypes):
+            sha.update(repr((name, self.__superclass.get(name), self.__interfaces.get(name))).encode('utf-8'))
+        return sha.hexdigest()
+
+
 class Analysis:
-    def __init__(self, vm=None):
+    def __init__(self, vm=None, max_methods=None):
         """
         Analysis Object
 
@@ -435,15 +648,26 @@ class Analysis:
 
         Multiple DalvikVMFormat Objects can be added using the function `add`
 
+        The :class:`MethodAnalysis` of a method is only created when it is
+        first requested with `get_method`. If `max_methods` is set, only the
+        `max_methods` most recently requested ones are kept, the instructions
+        of the other methods are released too.
+
         :param vm: inital DalvikVMFormat object (default None)
+        :param max_methods: maximum number of MethodAnalysis kept (default None, no limit)
         """
 
         # Contains DalvikVMFormat objects
         self.vms = []
         # A dict of {classname: ClassAnalysis}, populated on add(vm)
         self.classes = {}
-        # A dict of {EncodedMethod: MethodAnalysis}, populated on add(vm)
-        self.methods = {}
+        # A dict of {EncodedMethod: MethodAnalysis}, populated on get_method(method)
+        self.methods = OrderedDict()
+        self.max_methods = max_methods
+        # A dict of {EncodedMethod: DalvikVMFormat}, populated on add(vm)
+        self.__method_vms = {}
+        # ClassHierarchy of self.classes, built on get_class_hierarchy()
+        self.__class_hierarchy = None
 
         if vm:
             self.add(vm)
@@ -459,7 +683,20 @@ class Analysis:
             self.classes[current_class.get_name()] = ClassAnalysis(current_class)
 
         for method in vm.get_methods():
-            self.methods[method] = MethodAnalysis(vm, method)
+            self.__method_vms[method] = vm
+
+        self.__class_hierarchy = None
+
+    def get_class_hierarchy(self):
+        """
+        Return the :class:`ClassHierarchy` of the classes of all the
+        DalvikVMFormat objects added so far
+
+        :rtype: ClassHierarchy
+        """
+        if self.__class_hierarchy is None:
+            self.__class_hierarchy = ClassHierarchy(self.classes.values())
+        return self.__class_hierarchy
 
     def get_method(self, method):
         """
@@ -470,6 +707,19 @@ class Analysis:
         :return: :class:`MethodAnalysis` object for the given method, or None if method was not found
         """
         if method in self.methods:
+            self.methods.move_to_end(method)
             return self.methods[method]
-        else:
+
+        vm = self.__method_vms.get(method)
+        if vm is None:
             return None
+
+        mx = self.methods[method] = MethodAnalysis(vm, method)
+        if self.max_methods is not None:
+            while len(self.methods) > max(self.max_methods, 1):
+                evicted, _ = self.methods.popitem(last=False)
+                code = evicted.get_code()
+                if code:
+                    # Disassembled again if the method is requested later
+                    code.get_bc().reload()
+        return mx
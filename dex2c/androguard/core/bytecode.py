@@ -1,3 +1,4 @@
+from mmap import mmap
 from struct import unpack, pack
 
 
@@ -52,7 +53,7 @@ def object_to_bytes(obj):
         return pack("<L", obj)
     elif obj is None:
         return bytearray()
-    elif isinstance(obj, bytearray):
+    elif isinstance(obj, (bytearray, bytes, memoryview)):
         return obj
     else:
         return obj.get_raw()
@@ -61,10 +62,19 @@ class BuffHandle(object):
     """
     BuffHandle is a wrapper around bytes.
     It gives the ability to jump in the byte stream, just like with BytesIO.
+
+    By default the content of `buff` is copied into a bytearray and every
+    read returns a copy as well.
+    If `buff` is a memoryview or an mmap, it is used in place instead and
+    all reads return views into it, so large files are neither duplicated
+    in memory nor copied piece by piece while parsing.
     """
 
     def __init__(self, buff):
-        self.__buff = bytearray(buff)
+        if isinstance(buff, (memoryview, mmap)):
+            self.__buff = memoryview(buff)
+        else:
+            self.__buff = bytearray(buff)
         self.__idx = 0
 
     def __getitem__(self, item):
@@ -141,7 +151,7 @@ class BuffHandle(object):
         Read bytes with length `size` without incrementing the current offset
 
         :param int size: length to read in bytes
-        :rtype: bytearray
+        :rtype: bytearray or memoryview
         """
         return self.__buff[self.__idx:self.__idx + size]
 
@@ -158,7 +168,7 @@ class BuffHandle(object):
 
         :param int offset: offset to start reading
         :param int size: length of bytes to read
-        :rtype: bytearray
+        :rtype: bytearray or memoryview
         """
         return self.__buff[offset:offset + size]
 
@@ -167,7 +177,7 @@ class BuffHandle(object):
         Read all bytes from the start of `off` until the end of the buffer
 
         :param int off: starting offset
-        :rtype: bytearray
+        :rtype: bytearray or memoryview
         """
         if isinstance(off, SV):
             off = off.value
@@ -180,7 +190,7 @@ class BuffHandle(object):
         and increment the offset by `size`
 
         :param int size: length of bytes to read
-        :rtype: bytearray
+        :rtype: bytearray or memoryview
         """
         if isinstance(size, SV):
             size = size.value
@@ -202,7 +212,7 @@ class BuffHandle(object):
         """
         Return the whole buffer
 
-        :rtype: bytearray
+        :rtype: bytearray or memoryview
         """
         return self.__buff
 
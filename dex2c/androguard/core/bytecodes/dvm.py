@@ -7,7 +7,9 @@ import sys
 import re
 import struct
 import binascii
+import mmap
 import time
+import zipfile
 from struct import pack, unpack, calcsize
 import logging
 import warnings
@@ -88,11 +90,11 @@ def read_null_terminated_string(f):
     """
     x = bytearray()
     while True:
-        z = f.read(1)
-        if ord(z) == 0:
+        z = f.read(1)[0]
+        if z == 0:
             return x
         else:
-            x.append(ord(z))
+            x.append(z)
 
 
 def get_access_flags_string(value):
@@ -3771,8 +3773,8 @@ class FillArrayData(object):
         if buf_len % 2:
             buf_len += 1
 
-        self.data = buff[self.format_general_size:self.format_general_size +
-                                                  buf_len]
+        self.data = bytearray(buff[self.format_general_size:self.format_general_size +
+                                                            buf_len])
 
     def get_op_value(self):
         """
@@ -5787,7 +5789,7 @@ DALVIK_OPCODES_OPTIMIZED = {
 class Unresolved(Instruction):
     def __init__(self, cm, data):
         self.cm = cm
-        self.data = data
+        self.data = bytearray(data)
 
     def get_name(self):
         return "unresolved"
@@ -5826,21 +5828,21 @@ def get_extented_instruction(cm, op_value, buff):
     try:
         return DALVIK_OPCODES_EXTENDED_WIDTH[op_value][0](cm, buff)
     except struct.error:
-        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(buff)))
+        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(bytes(buff))))
 
 
 def get_optimized_instruction(cm, op_value, buff):
     try:
         return DALVIK_OPCODES_OPTIMIZED[op_value][0](cm, buff)
     except struct.error:
-        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(buff)))
+        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(bytes(buff))))
 
 
 def get_instruction_payload(op_value, buff):
     try:
         return DALVIK_OPCODES_PAYLOAD[op_value][0](buff)
     except struct.error:
-        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(buff)))
+        raise InvalidInstruction("Invalid Instruction for 0x%x:%s" % (op_value, repr(bytes(buff))))
 
 
 class LinearSweepAlgorithm(object):
@@ -5866,6 +5868,10 @@ class LinearSweepAlgorithm(object):
         if max_idx > len(insn):
             max_idx = len(insn)
 
+        # Slicing a memoryview does not copy, so each decoder gets the rest
+        # of the method for free and disassembly stays linear in its size.
+        insn = memoryview(insn)
+
         # Get instructions
         while idx < max_idx:
             obj = None
@@ -5926,6 +5932,8 @@ class DCode(object):
         self.size = size
 
         self.cached_instructions = None
+        # address -> position of the cached instructions
+        self.__off_to_pos = None
 
         self.idx = 0
 
@@ -5969,6 +5977,7 @@ class DCode(object):
         :type instructions: a list of :class:`Instruction`
         """
         self.cached_instructions = instructions
+        self.__off_to_pos = None
 
     def get_instructions(self):
         """
@@ -5988,6 +5997,7 @@ class DCode(object):
 
     def reload(self):
         self.cached_instructions = None
+        self.__off_to_pos = None
 
     def get_instruction(self, idx, off=None):
         """
@@ -6003,9 +6013,19 @@ class DCode(object):
         if off is not None:
             idx = self.off_to_pos(off)
         if self.cached_instructions is None:
-            self.get_instructions()
+            list(self.get_instructions())
         return self.cached_instructions[idx]
 
+    def __get_off_to_pos(self):
+        if self.__off_to_pos is None:
+            off_to_pos = {}
+            idx = 0
+            for nb, i in enumerate(self.get_instructions()):
+                off_to_pos.setdefault(idx, nb)
+                idx += i.get_length()
+            self.__off_to_pos = off_to_pos
+        return self.__off_to_pos
+
     def off_to_pos(self, off):
         """
         Get the position of an instruction by using the address
@@ -6015,14 +6035,7 @@ class DCode(object):
 
         :rtype: int
         """
-        idx = 0
-        nb = 0
-        for i in self.get_instructions():
-            if idx == off:
-                return nb
-            nb += 1
-            idx += i.get_length()
-        return -1
+        return self.__get_off_to_pos().get(off, -1)
 
     def get_ins_off(self, off):
         """
@@ -6033,12 +6046,10 @@ class DCode(object):
 
         :rtype: an :class:`Instruction` object
         """
-        idx = 0
-        for i in self.get_instructions():
-            if idx == off:
-                return i
-            idx += i.get_length()
-        return None
+        nb = self.__get_off_to_pos().get(off)
+        if nb is None:
+            return None
+        return self.cached_instructions[nb]
 
     def get_raw(self):
         """
@@ -6311,21 +6322,48 @@ class CodeItem(object):
         self.CM = cm
 
         self.offset = buff.get_idx()
+        self.size = size
+        self.buff = buff
 
         self.code = []
         self.__code_off = {}
+        self.__loaded = False
 
-        for i in range(0, size):
+        # In lazy mode a DalvikCode is only decoded when get_code() asks
+        # for its offset
+        if not cm.lazy:
+            self.load()
+
+    def load(self):
+        """
+        Decode all the DalvikCode items of the section
+        """
+        if self.__loaded:
+            return
+        self.__loaded = True
+
+        buff = self.buff
+        idx = buff.get_idx()
+        buff.set_idx(self.offset)
+
+        code = []
+        for i in range(0, self.size):
             # As we read the DalvikCode items from the map, there might be
             # padding bytes in between.
             # We know, that the alignment is 4 bytes.
             off = buff.get_idx()
             if off % 4 != 0:
-                buff.set_idx(off + (4 - (off % 4)))
+                off += 4 - (off % 4)
+                buff.set_idx(off)
+
+            x = DalvikCode(buff, self.CM)
+            # Keep the items already handed out by get_code()
+            x = self.__code_off.setdefault(x.get_off(), x)
+            code.append(x)
+        self.code = code
 
-            x = DalvikCode(buff, cm)
-            self.code.append(x)
-            self.__code_off[x.get_off()] = x
+        if self.CM.lazy:
+            buff.set_idx(idx)
 
     def set_off(self, off):
         self.offset = off
@@ -6337,22 +6375,35 @@ class CodeItem(object):
         try:
             return self.__code_off[off]
         except KeyError:
-            return None
+            if self.__loaded or off < self.offset or off >= self.buff.size():
+                return None
+
+        idx = self.buff.get_idx()
+        self.buff.set_idx(off)
+        x = DalvikCode(self.buff, self.CM)
+        self.buff.set_idx(idx)
+
+        self.code.append(x)
+        self.__code_off[off] = x
+        return x
 
     def reload(self):
         for i in self.code:
             i.reload()
 
     def get_obj(self):
+        self.load()
         return [i for i in self.code]
 
     def get_raw(self):
+        self.load()
         buff = bytearray()
         for c in self.code:
             buff += c.get_raw()
         return buff
 
     def get_length(self):
+        self.load()
         length = 0
         for i in self.code:
             length += i.get_size()
@@ -6525,6 +6576,8 @@ class ClassManager(object):
         self.__manage_item_off = []
 
         self.__strings_off = {}
+        # decoded strings by index in the string section
+        self.__decoded_strings = {}
         self.__typelists_off = {}
         self.__classdata_off = {}
 
@@ -6533,6 +6586,10 @@ class ClassManager(object):
 
         self.__cached_proto = {}
 
+        # map items which are not parsed yet, only used in lazy mode
+        self.lazy = config["LAZY_PARSING"]
+        self.__lazy_items = {}
+
         self.recode_ascii_string = config["RECODE_ASCII_STRING"]
         self.recode_ascii_string_meth = None
         if config["RECODE_ASCII_STRING_METH"]:
@@ -6556,13 +6613,64 @@ class ClassManager(object):
         """
         Returnes a object from as given offset inside the DEX file
         """
+        if offset not in self.__obj_offset and self.__lazy_items:
+            # Parse the section the offset belongs to
+            sections = [mi for mi in self.__lazy_items.values() if mi.get_offset() <= offset]
+            if sections:
+                mi = max(sections, key=lambda mi: mi.get_offset())
+                self.load_type_item(TYPE_MAP_ITEM[mi.get_type()])
         return self.__obj_offset[offset]
 
     def get_item_by_offset(self, offset):
+        if offset not in self.__item_offset:
+            for type_item, mi in list(self.__lazy_items.items()):
+                if mi.get_offset() == offset:
+                    self.load_type_item(type_item)
         return self.__item_offset[offset]
 
     def get_string_by_offset(self, offset):
-        return self.__strings_off[offset]
+        return self.__get_string_data(offset)
+
+    def add_lazy_type_item(self, type_item, c_item):
+        """
+        Register a map item which is parsed by :meth:`load_type_item`
+        the first time one of its elements is needed.
+        """
+        self.__lazy_items[type_item] = c_item
+
+    def load_type_item(self, type_item):
+        """
+        Parse the map item `type_item` if it was left for later, see
+        :meth:`add_lazy_type_item`.
+
+        The current offset of the buffer is preserved, as this might be
+        called while another section is being parsed.
+        """
+        c_item = self.__lazy_items.pop(type_item, None)
+        if c_item is None:
+            return
+
+        idx = self.buff.get_idx()
+        c_item.parse()
+        self.add_type_item(type_item, c_item, c_item.get_item())
+        c_item.reload()
+        self.buff.set_idx(idx)
+
+    def __get_item(self, type_item):
+        if type_item in self.__lazy_items:
+            self.load_type_item(type_item)
+        return self.__manage_item[type_item]
+
+    def __get_string_data(self, off):
+        if off not in self.__strings_off and "TYPE_STRING_DATA_ITEM" in self.__lazy_items:
+            # Strings are addressed by offset, so decode only the one asked for
+            section = self.__lazy_items["TYPE_STRING_DATA_ITEM"]
+            if section.get_offset() <= off < self.buff.size():
+                idx = self.buff.get_idx()
+                self.buff.set_idx(off)
+                self.__strings_off[off] = StringDataItem(self.buff, self)
+                self.buff.set_idx(idx)
+        return self.__strings_off[off]
 
     def get_lazy_analysis(self):
         """
@@ -6617,11 +6725,12 @@ class ClassManager(object):
 
     def get_code(self, idx):
         try:
-            return self.__manage_item["TYPE_CODE_ITEM"].get_code(idx)
+            return self.__get_item("TYPE_CODE_ITEM").get_code(idx)
         except KeyError:
             return None
 
     def get_class_data_item(self, off):
+        self.load_type_item("TYPE_CLASS_DATA_ITEM")
         i = self.__classdata_off.get(off)
         if i is None:
             log.warning("unknown class data item @ 0x%x" % off)
@@ -6629,7 +6738,7 @@ class ClassManager(object):
         return i
 
     def get_encoded_array_item(self, off):
-        for i in self.__manage_item["TYPE_ENCODED_ARRAY_ITEM"]:
+        for i in self.__get_item("TYPE_ENCODED_ARRAY_ITEM"):
             if i.get_off() == off:
                 return i
 
@@ -6642,22 +6751,15 @@ class ClassManager(object):
         if idx in self.hook_strings:
             return self.hook_strings[idx]
 
-        try:
-            off = self.__manage_item["TYPE_STRING_ID_ITEM"][idx].get_string_data_off()
-        except IndexError:
-            log.warning("unknown string item @ %d" % idx)
+        s = self.__get_decoded_string(idx)
+        if s is None:
             return "AG:IS: invalid string"
 
-        try:
-            if self.recode_ascii_string:
-                if self.recode_ascii_string_meth:
-                    return self.recode_ascii_string_meth(
-                        self.__strings_off[off].get())
-                return self.get_ascii_string(self.__strings_off[off].get())
-            return self.__strings_off[off].get()
-        except KeyError:
-            log.warning("unknown string item @ 0x%x(%d)" % (off, idx))
-            return "AG:IS: invalid string"
+        if self.recode_ascii_string:
+            if self.recode_ascii_string_meth:
+                return self.recode_ascii_string_meth(s)
+            return self.get_ascii_string(s)
+        return s
 
     def get_raw_string(self, idx):
         """
@@ -6665,22 +6767,36 @@ class ClassManager(object):
 
         :param int idx: the index in the string section
         """
+        s = self.__get_decoded_string(idx)
+        if s is None:
+            return "AG:IS: invalid string"
+        return s
+
+    def __get_decoded_string(self, idx):
+        s = self.__decoded_strings.get(idx)
+        if s is not None:
+            return s
+
         try:
-            off = self.__manage_item["TYPE_STRING_ID_ITEM"][idx].get_string_data_off()
+            off = self.__get_item("TYPE_STRING_ID_ITEM")[idx].get_string_data_off()
         except IndexError:
             log.warning("unknown string item @ %d" % idx)
-            return "AG:IS: invalid string"
+            return None
 
         try:
-            return self.__strings_off[off].get()
+            s = sys.intern(self.__get_string_data(off).get())
         except KeyError:
             log.warning("unknown string item @ 0x%x(%d)" % (off, idx))
-            return "AG:IS: invalid string"
+            return None
+
+        self.__decoded_strings[idx] = s
+        return s
 
     def get_type_list(self, off):
         if off == 0:
             return []
 
+        self.load_type_item("TYPE_TYPE_LIST")
         i = self.__typelists_off[off]
         return [type_.get_string() for type_ in i.get_list()]
 
@@ -6692,36 +6808,36 @@ class ClassManager(object):
         :return: the type name
         :rtype: str
         """
-        _type = self.__manage_item["TYPE_TYPE_ID_ITEM"].get(idx)
+        _type = self.__get_item("TYPE_TYPE_ID_ITEM").get(idx)
         if _type == -1:
             return "AG:ITI: invalid type"
         return self.get_string(_type)
 
     def get_type_ref(self, idx):
-        return self.__manage_item["TYPE_TYPE_ID_ITEM"].get(idx)
+        return self.__get_item("TYPE_TYPE_ID_ITEM").get(idx)
 
     def get_proto(self, idx):
         proto = self.__cached_proto.get(idx)
         if not proto:
-            proto = self.__manage_item["TYPE_PROTO_ID_ITEM"].get(idx)
+            proto = self.__get_item("TYPE_PROTO_ID_ITEM").get(idx)
             self.__cached_proto[idx] = proto
 
         return [proto.get_parameters_off_value(),
                 proto.get_return_type_idx_value()]
 
     def get_field(self, idx):
-        field = self.__manage_item["TYPE_FIELD_ID_ITEM"].get(idx)
+        field = self.__get_item("TYPE_FIELD_ID_ITEM").get(idx)
         return [field.get_class_name(), field.get_type(), field.get_name()]
 
     def get_field_ref(self, idx):
-        return self.__manage_item["TYPE_FIELD_ID_ITEM"].get(idx)
+        return self.__get_item("TYPE_FIELD_ID_ITEM").get(idx)
 
     def get_method(self, idx):
-        method = self.__manage_item["TYPE_METHOD_ID_ITEM"].get(idx)
+        method = self.__get_item("TYPE_METHOD_ID_ITEM").get(idx)
         return method.get_list()
 
     def get_method_ref(self, idx):
-        return self.__manage_item["TYPE_METHOD_ID_ITEM"].get(idx)
+        return self.__get_item("TYPE_METHOD_ID_ITEM").get(idx)
 
 
     def set_hook_string(self, idx, value):
@@ -6731,6 +6847,10 @@ class ClassManager(object):
         for i in self.__manage_item_off:
             if i > idx:
                 return i
+        # Sections which are not parsed yet still bound the previous one
+        following = [mi.get_offset() for mi in self.__lazy_items.values() if mi.get_offset() > idx]
+        if following:
+            return min(following)
         return idx
 
     def get_debug_off(self, off):
@@ -6764,6 +6884,16 @@ class MapList(object):
 
             buff.set_idx(idx + mi.get_length())
 
+        if self.CM.lazy:
+            # Sections are parsed by the ClassManager when first used
+            for mi in self.map_item:
+                if TYPE_MAP_ITEM[mi.get_type()] == "TYPE_MAP_LIST":
+                    mi.set_item(self)
+                    self.CM.add_type_item("TYPE_MAP_LIST", mi, self)
+                else:
+                    self.CM.add_lazy_type_item(TYPE_MAP_ITEM[mi.get_type()], mi)
+            return
+
         # TYPE_STRING_DATA_ITEM will be at the beginning of ordered
         # We want to parse this first, as other map items depend on it.
         ordered = sorted(self.map_item,
@@ -6832,13 +6962,23 @@ class MapList(object):
         """
         for i in self.map_item:
             if TYPE_MAP_ITEM[i.get_type()] == ttype:
+                self.CM.load_type_item(ttype)
                 return i.get_item()
         return None
 
+    def load(self):
+        """
+        Parse all the map items which were left for later in lazy mode
+        """
+        for i in self.map_item:
+            self.CM.load_type_item(TYPE_MAP_ITEM[i.get_type()])
+
     def get_obj(self):
+        self.load()
         return [x.get_obj() for x in self.map_item]
 
     def get_raw(self):
+        self.load()
         return pack("=I", self.size) + b''.join(x.get_raw()
                                                 for x in self.map_item)
 
@@ -6851,22 +6991,34 @@ class DalvikVMFormat(bytecode.BuffHandle):
     This class can parse a classes.dex file of an Android application (APK).
 
     :param buff: a string which represents the classes.dex file
-    :param decompiler: associate a decompiler object to display the java source code
+    :param lazy: parse the sections of the file, and the code of the methods,
+                 only when they are first used
     :type buff: string
-    :type decompiler: object
+    :type lazy: bool
 
     example::
 
         d = DalvikVMFormat( read("classes.dex") )
     """
 
-    def __init__(self, buff):
+    # Attributes which are only looked up when first used in lazy mode
+    _MAP_ITEM_ATTRIBUTES = {
+        "methods": "TYPE_METHOD_ID_ITEM",
+        "fields": "TYPE_FIELD_ID_ITEM",
+        "codes": "TYPE_CODE_ITEM",
+        "strings": "TYPE_STRING_DATA_ITEM",
+        "debug": "TYPE_DEBUG_INFO_ITEM",
+        "header": "TYPE_HEADER_ITEM",
+    }
+
+    def __init__(self, buff, lazy=False):
 
         super(DalvikVMFormat, self).__init__(buff)
 
         self.config = {
             "RECODE_ASCII_STRING": False,
             "RECODE_ASCII_STRING_METH": None,
+            "LAZY_PARSING": lazy,
         }
 
         self.CM = ClassManager(self, self.config)
@@ -6874,6 +7026,47 @@ class DalvikVMFormat(bytecode.BuffHandle):
 
         self._load(buff)
 
+    @classmethod
+    def from_file(cls, filename, lazy=False):
+        """
+        Parse a classes.dex file without loading it in memory.
+        The file is mapped read only and parsed in place.
+
+        :param str filename: path of the dex file
+        :param bool lazy: see :class:`DalvikVMFormat`
+
+        :rtype: a :class:`DalvikVMFormat` object
+        """
+        with open(filename, "rb") as fd:
+            return cls(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ), lazy)
+
+    @classmethod
+    def from_zip_entry(cls, zip_file, name, lazy=False):
+        """
+        Parse a dex file stored inside an APK (or any zip archive).
+
+        Uncompressed entries are mapped straight from the archive, compressed
+        ones are inflated once and parsed without a further copy.
+
+        :param zip_file: the archive, opened from a file on disk
+        :type zip_file: :class:`zipfile.ZipFile`
+        :param str name: name of the entry, e.g. "classes2.dex"
+        :param bool lazy: see :class:`DalvikVMFormat`
+
+        :rtype: a :class:`DalvikVMFormat` object
+        """
+        info = zip_file.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1 or not zip_file.filename:
+            return cls(memoryview(zip_file.read(name)), lazy)
+
+        with open(zip_file.filename, "rb") as fd:
+            archive = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        # The data follows the local file header, whose name and extra
+        # fields may differ from the ones of the central directory.
+        name_len, extra_len = unpack("=HH", archive[info.header_offset + 26:info.header_offset + 30])
+        start = info.header_offset + 30 + name_len + extra_len
+        return cls(memoryview(archive)[start:start + info.file_size], lazy)
+
     def _load(self, buff):
         self.__header = HeaderItem(0, self, ClassManager(None, self.config))
 
@@ -6883,15 +7076,22 @@ class DalvikVMFormat(bytecode.BuffHandle):
             self.map_list = MapList(self.CM, self.__header.map_off, self)
 
             self.classes = self.map_list.get_item_type("TYPE_CLASS_DEF_ITEM")
-            self.methods = self.map_list.get_item_type("TYPE_METHOD_ID_ITEM")
-            self.fields = self.map_list.get_item_type("TYPE_FIELD_ID_ITEM")
-            self.codes = self.map_list.get_item_type("TYPE_CODE_ITEM")
-            self.strings = self.map_list.get_item_type("TYPE_STRING_DATA_ITEM")
-            self.debug = self.map_list.get_item_type("TYPE_DEBUG_INFO_ITEM")
-            self.header = self.map_list.get_item_type("TYPE_HEADER_ITEM")
+            if not self.CM.lazy:
+                for name, ttype in self._MAP_ITEM_ATTRIBUTES.items():
+                    setattr(self, name, self.map_list.get_item_type(ttype))
 
         self._flush()
 
+    def __getattr__(self, name):
+        # Only reached in lazy mode, where the attributes of
+        # _MAP_ITEM_ATTRIBUTES are not set by _load()
+        ttype = self._MAP_ITEM_ATTRIBUTES.get(name)
+        if ttype is None or "map_list" not in self.__dict__:
+            raise AttributeError(name)
+        value = self.map_list.get_item_type(ttype)
+        setattr(self, name, value)
+        return value
+
     def _flush(self):
         """
         Flush all caches
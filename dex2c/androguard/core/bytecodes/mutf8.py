@@ -1,5 +1,6 @@
 import builtins
 from builtins import str
+import re
 import struct
 
 
@@ -22,6 +23,13 @@ def chr(val):
             raise e
 
 
+# Length of a MUTF-8 sequence given its first byte, 0 if it can not start one
+_SEQUENCE_LENGTH = bytes([1] * 0x80 + [0] * 0x40 + [2] * 0x20 + [3] * 0x10 + [0] * 0x10)
+
+# Characters which must be rewritten by patch_string
+_SURROGATES = re.compile(u"[\ud800-\udfff]")
+
+
 def decode(b):
     """
     Decode bytes as MUTF-8
@@ -30,39 +38,54 @@ def decode(b):
 
     Surrogates will be returned as two 16 bit characters.
 
+    Apart from the encoded null character (0xC0 0x80) and the surrogates,
+    well formed strings are also valid UTF-8, so they are decoded by the
+    builtin codec. Only the other overlong sequences go through
+    :func:`decode_sequences`.
+
     :param b: bytes to decode
     :rtype: unicode (py2), str (py3) of 16bit chars
     :raises: UnicodeDecodeError if string is not decodable
     """
-    res = u""
-
-    b = iter(bytearray(b))
-
-    for x in b:
-        if x >> 7 == 0:
-            # Single char:
-            res += chr(x & 0x7f)
-        elif x >> 5 == 0b110:
-            # 2 byte Multichar
-            b2 = next(b)
-            if b2 >> 6 != 0b10:
-                raise UnicodeDecodeError("Second byte of 2 byte sequence does not looks right.")
-
-            res += chr((x & 0x1f) << 6 | b2 & 0x3f)
-        elif x >> 4 == 0b1110:
-            # 3 byte Multichar
-            b2 = next(b)
-            b3 = next(b)
-            if b2 >> 6 != 0b10:
-                raise UnicodeDecodeError("Second byte of 3 byte sequence does not looks right.")
-            if b3 >> 6 != 0b10:
-                raise UnicodeDecodeError("Third byte of 3 byte sequence does not looks right.")
-
-            res += chr((x & 0xf) << 12 | (b2 & 0x3f) << 6 | b3 & 0x3f)
+    b = bytes(b)
+    try:
+        s = b.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass")
+    except UnicodeDecodeError:
+        return decode_sequences(b)
+
+    # 4 byte sequences are valid UTF-8, but not MUTF-8
+    if s.isascii() or max(b) < 0xf0:
+        return s
+    return decode_sequences(b)
+
+
+def decode_sequences(b):
+    """
+    Decode bytes as MUTF-8, one sequence after another.
+    Used by :func:`decode` for the strings which are not valid UTF-8.
+
+    :param b: bytes to decode
+    :rtype: str of 16bit chars
+    :raises: UnicodeDecodeError if string is not decodable
+    """
+    res = []
+    size = len(b)
+    i = 0
+    while i < size:
+        x = b[i]
+        length = _SEQUENCE_LENGTH[x]
+        if length == 1:
+            res.append(x)
+        elif length == 2 and i + 1 < size and b[i + 1] >> 6 == 0b10:
+            res.append((x & 0x1f) << 6 | b[i + 1] & 0x3f)
+        elif length == 3 and i + 2 < size and b[i + 1] >> 6 == 0b10 and b[i + 2] >> 6 == 0b10:
+            res.append((x & 0xf) << 12 | (b[i + 1] & 0x3f) << 6 | b[i + 2] & 0x3f)
         else:
-            raise UnicodeDecodeError("Could not decode byte")
+            raise UnicodeDecodeError("mutf-8", b, i, i + max(length, 1),
+                                     "invalid or truncated sequence")
+        i += length
 
-    return res
+    return u"".join(map(chr, res))
 
 
 class PeekIterator:
@@ -102,6 +125,9 @@ def patch_string(s):
     :param s: input string
     :return: string with escaped lonely surrogates and 32bit surrogates
     """
+    if not _SURROGATES.search(s):
+        return s
+
     res = u''
     it = PeekIterator(s)
     for c in it:
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Regression benchmark for the construction of the basic blocks of a method.
+
+Builds a synthetic method made of many packed-switch instructions, each one
+jumping to a few dozen small cases, and compares
+:meth:`MethodAnalysis._create_basic_block` with the legacy version, which
+matched every instruction name against the BasicOPCODES regexes and looked
+up the branch targets in a list.
+
+Run from the dex2c directory:
+
+    python3 bench/bench_basic_blocks.py -s 100 -c 32
+"""
+import argparse
+import sys
+from os import path
+from struct import pack
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from androguard.core.analysis import analysis
+from androguard.core.bytecodes import dvm
+
+
+class Code(object):
+    def __init__(self, insns):
+        self.bc = dvm.DCode(None, 0, len(insns) // 2, insns)
+
+    def get_bc(self):
+        return self.bc
+
+    def get_tries_size(self):
+        return 0
+
+    def get_length(self):
+        return self.bc.size * 2
+
+
+class Method(object):
+    def __init__(self, insns):
+        self.code = Code(insns)
+
+    def get_code(self):
+        return self.code
+
+    def get_name(self):
+        return "switches"
+
+    def get_instructions(self):
+        return self.code.get_bc().get_instructions()
+
+
+def build_switch_method(switches, cases):
+    """
+    Return the instructions of a method made of `switches` blocks like
+
+        packed-switch v0, :payload
+        const/4 v1, #0
+        goto/16 :next
+        ...
+        const/4 v1, #n
+        goto/16 :next
+      :next
+
+    followed by a return-void and the payloads.
+    """
+    insns = []
+    switch_pos = []
+    for _ in range(switches):
+        switch_pos.append(len(insns))
+        # packed-switch, the offset of the payload is patched below
+        insns += [0x002b, 0, 0]
+        case_size = 1 + 2
+        end = len(insns) + cases * case_size
+        for case in range(cases):
+            insns.append(0x12 | (((case & 0x7) << 4 | 1) << 8))
+            insns += [0x0029, (end - len(insns)) & 0xffff]
+    insns.append(0x000e)
+
+    for pos in switch_pos:
+        if len(insns) % 2:
+            insns.append(0x0000)
+        off = len(insns) - pos
+        insns[pos + 1] = off & 0xffff
+        insns[pos + 2] = off >> 16
+        insns += [0x0100, cases, 0, 0]
+        for case in range(cases):
+            # relative to the packed-switch
+            target = 3 + case * case_size
+            insns += [target & 0xffff, target >> 16]
+
+    return bytearray(pack("=%dH" % len(insns), *insns))
+
+
+class LegacyMethodAnalysis(analysis.MethodAnalysis):
+    def _create_basic_block(self):
+        current_basic = analysis.DVMBasicBlock(0, self.get_vm(), self.method, self.basic_blocks)
+        self.basic_blocks.push(current_basic)
+
+        bc = self.code.get_bc()
+        l = []
+        h = {}
+        idx = 0
+
+        for i in bc.get_instructions():
+            for j in analysis.BasicOPCODES:
+                if j.match(i.get_name()) is not None:
+                    v = dvm.determineNext(i, idx, self.method)
+                    h[idx] = v
+                    l.extend(v)
+                    break
+
+            idx += i.get_length()
+
+        excepts = dvm.determineException(self.get_vm(), self.method)
+        for i in excepts:
+            l.extend([i[0]])
+            for handler in i[2:]:
+                l.append(handler[1])
+
+        idx = 0
+        for i in bc.get_instructions():
+            if idx in l:
+                if current_basic.get_nb_instructions() != 0:
+                    current_basic = analysis.DVMBasicBlock(current_basic.get_end(), self.get_vm(), self.method, self.basic_blocks)
+                    self.basic_blocks.push(current_basic)
+
+            current_basic.push(i)
+
+            if idx in h:
+                current_basic = analysis.DVMBasicBlock(current_basic.get_end(), self.get_vm(), self.method, self.basic_blocks)
+                self.basic_blocks.push(current_basic)
+
+            idx += i.get_length()
+
+        if current_basic.get_nb_instructions() == 0:
+            self.basic_blocks.pop(-1)
+
+        for i in self.basic_blocks.get():
+            try:
+                i.set_childs(h[i.end - i.get_last_length()])
+            except KeyError:
+                i.set_childs([])
+
+        self.exceptions.add(excepts, self.basic_blocks)
+
+        for i in self.basic_blocks.get():
+            i.set_exception_analysis(self.exceptions.get_exception(i.start, i.end - 1))
+
+
+def get_edges(mx):
+    return [
+        (bb.get_start(), bb.get_end(), [(c[0], c[1], c[2].get_start()) for c in bb.get_next()])
+        for bb in mx.get_basic_blocks().get()
+    ]
+
+
+def run(cls, insns, repeat):
+    best = None
+    mx = None
+    for _ in range(repeat):
+        method = Method(insns)
+        # Decode the instructions out of the measure
+        list(method.get_instructions())
+        start = perf_counter()
+        mx = cls(None, method)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, mx
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--switches", type=int, default=100, help="Number of packed-switch instructions")
+    parser.add_argument("-c", "--cases", type=int, default=32, help="Number of cases of each switch")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    insns = build_switch_method(args.switches, args.cases)
+    legacy, legacy_mx = run(LegacyMethodAnalysis, insns, args.repeat)
+    current, current_mx = run(analysis.MethodAnalysis, insns, args.repeat)
+    assert get_edges(legacy_mx) == get_edges(current_mx), "basic blocks mismatch"
+
+    print("%d instructions, %d basic blocks" % (
+        len(list(current_mx.method.get_instructions())),
+        len(current_mx.get_basic_blocks().gets())))
+    print("  legacy         : %.3fs" % legacy)
+    print("  MethodAnalysis : %.3fs" % current)
+    print("  speedup        : %.2fx" % (legacy / current))
+
+
+if __name__ == "__main__":
+    main()
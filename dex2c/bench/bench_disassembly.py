@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for method disassembly.
+
+Compares the legacy decoding loop, which handed every instruction decoder a
+copy of the rest of the method (``insn[idx:]``), with
+:class:`LinearSweepAlgorithm`, which decodes from a memoryview.
+
+Run from the dex2c directory:
+
+    python3 bench/bench_disassembly.py -i example.apk
+"""
+import argparse
+import re
+import sys
+from os import path
+from struct import unpack
+from time import perf_counter
+from zipfile import ZipFile
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from androguard.core.bytecodes import dvm
+
+
+def legacy_sweep(cm, size, insn):
+    max_idx = min(size * 2, len(insn))
+    idx = 0
+    while idx < max_idx:
+        op_value = insn[idx]
+        obj = None
+        if (op_value == 0x00 or op_value == 0xff) and (idx + 2) < max_idx:
+            op_value = unpack("=H", insn[idx:idx + 2])[0]
+            if op_value in dvm.DALVIK_OPCODES_PAYLOAD:
+                obj = dvm.get_instruction_payload(op_value, insn[idx:])
+            elif op_value in dvm.DALVIK_OPCODES_EXTENDED_WIDTH:
+                obj = dvm.get_extented_instruction(cm, op_value, insn[idx:])
+        if obj is None:
+            obj = dvm.get_instruction(cm, insn[idx], insn[idx:])
+        yield obj
+        idx += obj.get_length()
+
+
+def linear_sweep(cm, size, insn):
+    return dvm.LinearSweepAlgorithm().get_instructions(cm, size, insn, 0)
+
+
+def load_codes(apk):
+    zip_file = ZipFile(apk)
+    codes = []
+    for name in zip_file.namelist():
+        if re.match("classes(\\d*).dex", name):
+            vm = dvm.DalvikVMFormat(zip_file.read(name))
+            for m in vm.get_methods():
+                code = m.get_code()
+                if code:
+                    bc = code.get_bc()
+                    codes.append((vm.CM, bc.size, bc.get_insn()))
+    return codes
+
+
+def run(codes, sweep, repeat):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        count = 0
+        start = perf_counter()
+        for cm, size, insn in codes:
+            for _ in sweep(cm, size, insn):
+                count += 1
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default="example.apk", help="Input apk file path")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Number of runs, the best one is reported")
+    parser.add_argument(
+        "-s", "--scale", type=int, default=3,
+        help="Repeat the merged method body N times",
+    )
+    args = parser.parse_args()
+
+    codes = load_codes(args.input)
+    # All method bodies back to back, to emulate the 30-60 KB methods
+    # produced by obfuscators.
+    merged = bytearray()
+    for _, _, insn in codes:
+        merged += insn
+    merged *= args.scale
+    large = [(codes[0][0], len(merged) // 2, merged)]
+
+    for title, workload in (("per method", codes), ("one %d KB method" % (len(merged) // 1024), large)):
+        legacy, n1 = run(workload, legacy_sweep, args.repeat)
+        linear, n2 = run(workload, linear_sweep, args.repeat)
+        assert n1 == n2, "instruction count mismatch: %d != %d" % (n1, n2)
+        print("%s: %d instructions" % (title, n1))
+        print("  legacy slicing : %.3fs" % legacy)
+        print("  memoryview     : %.3fs" % linear)
+        print("  speedup        : %.2fx" % (legacy / linear))
+
+
+if __name__ == "__main__":
+    main()
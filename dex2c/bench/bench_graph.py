@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the traversals of :class:`dex2c.graph.Graph` on synthetic
+control flow graphs.
+
+Compares :meth:`Graph.post_order` and :func:`dom_lt` with the legacy
+recursive versions on a long chain of nested loops and on a random graph,
+both made of `-b` blocks.
+
+Run from the dex2c directory:
+
+    python3 bench/bench_graph.py -b 10000
+"""
+import argparse
+import random
+import sys
+from collections import defaultdict
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from dex2c.graph import Graph, dom_lt
+
+
+class Node(object):
+    def __init__(self, start):
+        self.start = start
+        self.num = 0
+        self.po = 0
+        self.in_catch = False
+
+    def __repr__(self):
+        return 'Node(%d)' % self.start
+
+
+def build_nested_loops(blocks):
+    """
+    Return a graph where each block jumps to the next one and every other
+    block also jumps back to the block mirroring it, i.e. loops nested
+    `blocks / 2` deep.
+    """
+    graph = Graph()
+    nodes = [Node(i) for i in range(blocks)]
+    for node in nodes:
+        graph.add_node(node)
+    for i in range(blocks - 1):
+        graph.add_edge(nodes[i], nodes[i + 1])
+    for i in range(blocks // 2, blocks, 2):
+        graph.add_edge(nodes[i], nodes[blocks - 1 - i])
+    graph.entry = nodes[0]
+    return graph
+
+
+def build_random(blocks, seed):
+    """
+    Return a graph where each block falls through to the next one and
+    branches to another random block, plus a few catch edges.
+    """
+    rand = random.Random(seed)
+    graph = Graph()
+    nodes = [Node(i) for i in range(blocks)]
+    for node in nodes:
+        graph.add_node(node)
+    for i in range(blocks - 1):
+        graph.add_edge(nodes[i], nodes[i + 1])
+        graph.add_edge(nodes[i], nodes[rand.randrange(blocks)])
+        if rand.random() < 0.1:
+            graph.add_catch_edge(nodes[i], nodes[rand.randrange(blocks)])
+    graph.entry = nodes[0]
+    return graph
+
+
+def legacy_post_order(graph):
+    def _visit(n, cnt):
+        visited.add(n)
+        for suc in graph.all_sucs(n):
+            if suc not in visited:
+                for cnt, s in _visit(suc, cnt):
+                    yield cnt, s
+        n.po = cnt
+        yield cnt + 1, n
+
+    visited = set()
+    for _, node in _visit(graph.entry, 1):
+        yield node
+
+
+def legacy_dom_lt(graph):
+    def _dfs(v, n):
+        semi[v] = n = n + 1
+        vertex[n] = label[v] = v
+        ancestor[v] = 0
+        for w in graph.all_sucs(v):
+            if not semi[w]:
+                parent[w] = v
+                n = _dfs(w, n)
+            pred[w].add(v)
+        return n
+
+    def _compress(v):
+        u = ancestor[v]
+        if ancestor[u]:
+            _compress(u)
+            if semi[label[u]] < semi[label[v]]:
+                label[v] = label[u]
+            ancestor[v] = ancestor[u]
+
+    def _eval(v):
+        if ancestor[v]:
+            _compress(v)
+            return label[v]
+        return v
+
+    def _link(v, w):
+        ancestor[w] = v
+
+    parent, ancestor, vertex = {}, {}, {}
+    label, dom = {}, {}
+    pred, bucket = defaultdict(set), defaultdict(set)
+
+    semi = {v: 0 for v in graph.nodes}
+    n = _dfs(graph.entry, 0)
+    for i in range(n, 1, -1):
+        w = vertex[i]
+        for v in pred[w]:
+            u = _eval(v)
+            y = semi[w] = min(semi[w], semi[u])
+        bucket[vertex[y]].add(w)
+        pw = parent[w]
+        _link(pw, w)
+        bpw = bucket[pw]
+        while bpw:
+            v = bpw.pop()
+            u = _eval(v)
+            dom[v] = u if semi[u] < semi[v] else pw
+    for i in range(2, n + 1):
+        w = vertex[i]
+        dw = dom[w]
+        if dw != vertex[semi[w]]:
+            dom[w] = dom[dw]
+    dom[graph.entry] = None
+    return dom
+
+
+def measure(func, graph, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func(graph)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--blocks", type=int, default=10000, help="Number of blocks of the graphs")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random graph")
+    parser.add_argument("--no-legacy", action="store_true",
+                        help="Do not run the recursive versions, which need a deep C stack on large graphs")
+    args = parser.parse_args()
+
+    # The recursive versions need about one frame per block
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * args.blocks + 1000))
+
+    for title, graph in (("nested loops", build_nested_loops(args.blocks)),
+                         ("random", build_random(args.blocks, args.seed))):
+        print("%s: %d blocks" % (title, len(graph)))
+        benchmarks = [
+            ("post_order", lambda g: [n.start for n in g.post_order()], lambda g: [n.start for n in legacy_post_order(g)]),
+            ("dom_lt", dom_lt, legacy_dom_lt),
+        ]
+        for name, func, legacy_func in benchmarks:
+            current, result = measure(func, graph, args.repeat)
+            print("  %-10s         : %.3fs" % (name, current))
+            if args.no_legacy:
+                continue
+            legacy, legacy_result = measure(legacy_func, graph, args.repeat)
+            assert result == legacy_result, "%s mismatch" % name
+            print("  %-10s (legacy): %.3fs" % (name, legacy))
+            print("  %-10s speedup : %.2fx" % (name, legacy / current))
+
+
+if __name__ == "__main__":
+    main()
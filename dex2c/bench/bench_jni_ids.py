@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the generated code for the caches of the class, method
+and field IDs.
+
+Compiles a method of the input apk three times, with the IDs cached in locals
+of each call, with --static-ids and with --resolve-table, builds each version
+on the host with the runtime of project/jni/nc and calls it in a loop with a
+fake JNIEnv. The JNI functions of the fake JNIEnv do nothing, what is
+measured is the code around them: the resolution of the IDs through the
+mutexes and the maps of Dex2C.cpp on every call, against a single load once
+they are resolved.
+
+Needs a C++ compiler and the jni.h of the NDK (toolchains/llvm/prebuilt/*/
+sysroot/usr/include) or of a JDK (include and include/<os>). Run from the
+dex2c directory:
+
+    python3 bench/bench_jni_ids.py --jni-include $JAVA_HOME/include \\
+        --jni-include $JAVA_HOME/include/linux -t 4
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from os import path
+from zipfile import ZipFile
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from androguard.core.analysis import analysis
+from androguard.core.bytecodes import dvm
+from dex2c.compiler import Dex2C
+from dex2c.util import JniLongName, get_method_triple, get_native_type, get_params_type
+from dex2c.writer import ResolveTable
+
+RUNTIME_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), "project", "jni", "nc")
+
+DRIVER = r"""
+#include <android/log.h>
+#include <jni.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <chrono>
+#include <thread>
+#include <type_traits>
+#include <vector>
+
+extern "C" %(rtype)s %(name)s(JNIEnv *env, jobject thiz%(params)s);
+
+const char *dynamic_register_compile_methods(JNIEnv *env) {
+    return NULL;
+}
+
+extern "C" int __android_log_print(int prio, const char *tag, const char *fmt, ...) {
+    return 0;
+}
+
+typedef std::remove_const<std::remove_pointer<decltype(JNIEnv::functions)>::type>::type FunctionTable;
+
+static char dummy_object[8];
+
+static intptr_t any_function() {
+    return (intptr_t) dummy_object;
+}
+
+static jclass find_class(JNIEnv *, const char *) {
+    return (jclass) dummy_object;
+}
+
+static jobject new_ref(JNIEnv *, jobject obj) {
+    return obj;
+}
+
+static void delete_ref(JNIEnv *, jobject) {
+}
+
+static jmethodID get_method_id(JNIEnv *, jclass, const char *, const char *) {
+    return (jmethodID) dummy_object;
+}
+
+static jfieldID get_field_id(JNIEnv *, jclass, const char *, const char *) {
+    return (jfieldID) dummy_object;
+}
+
+static jboolean exception_check(JNIEnv *) {
+    return JNI_FALSE;
+}
+
+static jthrowable exception_occurred(JNIEnv *) {
+    return NULL;
+}
+
+static jboolean is_instance_of(JNIEnv *, jobject, jclass) {
+    return JNI_TRUE;
+}
+
+static FunctionTable functions;
+
+static void run(long calls) {
+    JNIEnv env;
+    env.functions = &functions;
+    for (long i = 0; i < calls; i++) {
+        %(name)s(&env, (jobject) dummy_object%(args)s);
+    }
+}
+
+int main(int argc, char **argv) {
+    long calls = atol(argv[1]);
+    int threads = atoi(argv[2]);
+
+    void **slots = (void **) &functions;
+    for (size_t i = 0; i < sizeof(functions) / sizeof(void *); i++) {
+        slots[i] = (void *) any_function;
+    }
+    functions.FindClass = find_class;
+    functions.NewGlobalRef = new_ref;
+    functions.NewLocalRef = new_ref;
+    functions.DeleteLocalRef = delete_ref;
+    functions.GetMethodID = get_method_id;
+    functions.GetStaticMethodID = get_method_id;
+    functions.GetFieldID = get_field_id;
+    functions.GetStaticFieldID = get_field_id;
+    functions.ExceptionCheck = exception_check;
+    functions.ExceptionOccurred = exception_occurred;
+    functions.IsInstanceOf = is_instance_of;
+
+    auto start = std::chrono::steady_clock::now();
+    std::vector<std::thread> workers;
+    for (int i = 0; i < threads; i++) {
+        workers.emplace_back(run, calls);
+    }
+    for (auto &worker : workers) {
+        worker.join();
+    }
+    std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+    printf("%%f\n", calls * threads / elapsed.count());
+    return 0;
+}
+"""
+
+# Name and Dex2C options of the compared versions, the first one is the reference
+MODES = [
+    ("local_ids", {}),
+    ("static_ids", {"static_ids": True}),
+    ("resolve_table", {"resolve_table": True}),
+]
+
+# Used when the include directories are not the ones of the NDK
+FALLBACK_HEADERS = {
+    path.join("android", "log.h"): """
+#pragma once
+enum { ANDROID_LOG_DEBUG = 3, ANDROID_LOG_FATAL = 7 };
+extern "C" int __android_log_print(int prio, const char *tag, const char *fmt, ...);
+""",
+}
+
+
+def get_method(vms, triple):
+    for vm in vms:
+        for m in vm.get_methods():
+            if "".join(get_method_triple(m)) == triple:
+                return vm, m
+    raise SystemExit("method %s not found" % triple)
+
+
+def write_driver(filepath, method):
+    cls_name, name, proto = get_method_triple(method)
+    params_type = get_params_type(method.get_descriptor())
+    rtype = proto.split(")")[-1]
+    with open(filepath, "w") as fp:
+        fp.write(DRIVER % {
+            "name": JniLongName(cls_name, name, proto),
+            "rtype": "void" if rtype == "V" else get_native_type(rtype),
+            "params": "".join(", %s" % get_native_type(ptype) for ptype in params_type),
+            "args": "".join(
+                ", (jobject) dummy_object" if ptype[0] in "L[" else ", 0" for ptype in params_type),
+        })
+
+
+def build(cxx, workdir, name, code, table_refs, includes):
+    resolve_table = ResolveTable()
+    source = path.join(workdir, name + ".cpp")
+    with open(source, "w") as fp:
+        fp.write('#include "Dex2C.h"\n' + resolve_table.get_defines(table_refs) + code)
+    table_source = path.join(workdir, name + "_table.cpp")
+    with open(table_source, "w") as fp:
+        fp.write(resolve_table.get_source())
+    binary = path.join(workdir, name)
+    cmd = [cxx, "-std=c++17", "-O2", "-w", "-pthread"]
+    cmd += ["-I" + include for include in includes]
+    cmd += [
+        "-I" + RUNTIME_DIR, "-I" + workdir,
+        path.join(workdir, "driver.cpp"), source, table_source,
+        path.join(RUNTIME_DIR, "Dex2C.cpp"), path.join(RUNTIME_DIR, "well_known_classes.cpp"),
+        "-o", binary,
+    ]
+    subprocess.check_call(cmd)
+    return binary
+
+
+def run(binary, calls, threads, repeat):
+    best = None
+    for _ in range(repeat):
+        out = subprocess.check_output([binary, str(calls), str(threads)], universal_newlines=True)
+        rate = float(out)
+        best = rate if best is None else max(best, rate)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default="example.apk", help="Input apk file path")
+    parser.add_argument("-m", "--method", default="Lcom/ratul/fancy/FancyDialog;setTitleColor(I)V",
+                        help="Method to benchmark, class, name and descriptor")
+    parser.add_argument("--jni-include", action="append", default=[], help="Directory of jni.h, can be repeated")
+    parser.add_argument("--cxx", default=os.environ.get("CXX", "g++"), help="C++ compiler")
+    parser.add_argument("-c", "--calls", type=int, default=1000000, help="Number of calls of each thread")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="Number of threads")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    zip_file = ZipFile(args.input)
+    vms = [
+        dvm.DalvikVMFormat(zip_file.read(name))
+        for name in zip_file.namelist()
+        if name.startswith("classes") and name.endswith(".dex")
+    ]
+    vmx = analysis.Analysis()
+    for vm in vms:
+        vmx.add(vm)
+    vm, method = get_method(vms, args.method)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for header, content in FALLBACK_HEADERS.items():
+            os.makedirs(path.dirname(path.join(workdir, header)), exist_ok=True)
+            with open(path.join(workdir, header), "w") as fp:
+                fp.write(content)
+        write_driver(path.join(workdir, "driver.cpp"), method)
+
+        rates = {}
+        for name, options in MODES:
+            compiler = Dex2C(vm, vmx, False, False, **options)
+            code, _, table_refs = compiler.get_source_method(method)
+            binary = build(args.cxx, workdir, name, code, table_refs, args.jni_include)
+            rates[name] = run(binary, args.calls, args.threads, args.repeat)
+
+    print("%s, %d threads" % (args.method, args.threads))
+    for name, _ in MODES:
+        print("  %-13s: %12.0f calls/s, %6.2fx" % (name, rates[name], rates[name] / rates["local_ids"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for MUTF-8 string decoding.
+
+Compares the legacy per-character decoder with :func:`mutf8.decode`, which
+hands the strings that are valid UTF-8 to the builtin codec, and measures
+the decoded string cache of :class:`ClassManager`.
+
+Run from the dex2c directory:
+
+    python3 bench/bench_mutf8.py -i example.apk
+"""
+import argparse
+import re
+import sys
+from os import path
+from time import perf_counter
+from zipfile import ZipFile
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from androguard.core.bytecodes import dvm, mutf8
+
+
+def legacy_decode(b):
+    res = u""
+
+    b = iter(bytearray(b))
+
+    for x in b:
+        if x >> 7 == 0:
+            res += chr(x & 0x7f)
+        elif x >> 5 == 0b110:
+            b2 = next(b)
+            res += chr((x & 0x1f) << 6 | b2 & 0x3f)
+        elif x >> 4 == 0b1110:
+            b2 = next(b)
+            b3 = next(b)
+            res += chr((x & 0xf) << 12 | (b2 & 0x3f) << 6 | b3 & 0x3f)
+        else:
+            raise ValueError("Could not decode byte")
+
+    return res
+
+
+def load_vms(apk):
+    zip_file = ZipFile(apk)
+    return [
+        dvm.DalvikVMFormat(zip_file.read(name))
+        for name in zip_file.namelist()
+        if re.match("classes(\\d*).dex", name)
+    ]
+
+
+def load_strings(vms):
+    strings = []
+    for vm in vms:
+        for item in vm.strings:
+            strings.append(bytes(item.data))
+    return strings
+
+
+def run(func, args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        for arg in args:
+            func(arg)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default="example.apk", help="Input apk file path")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    vms = load_vms(args.input)
+    strings = load_strings(vms)
+    # Strings that can not be handled by the builtin codec: surrogate
+    # pairs and encoded null characters
+    special = [
+        s + b"\xed\xa0\xbd\xed\xb8\x80" + s + b"\xc0\x80" for s in strings
+    ]
+
+    for title, workload in (("dex strings", strings), ("with surrogates", special)):
+        for s in workload:
+            assert legacy_decode(s) == mutf8.decode(s), s
+        legacy = run(legacy_decode, workload, args.repeat)
+        fast = run(mutf8.decode, workload, args.repeat)
+        print("%s: %d strings, %d bytes" % (title, len(workload), sum(map(len, workload))))
+        print("  legacy decode : %.3fs" % legacy)
+        print("  mutf8.decode  : %.3fs" % fast)
+        print("  speedup       : %.2fx" % (legacy / fast))
+
+    # Method, type and field names are looked up again and again while
+    # compiling, the first lookup decodes the string and the next ones
+    # hit the cache.
+    lookups = [(vm.CM, idx) for vm in vms for idx in range(vm.header.string_ids_size)]
+    start = perf_counter()
+    for cm, idx in lookups:
+        cm.get_string(idx)
+    first = perf_counter() - start
+    start = perf_counter()
+    for cm, idx in lookups:
+        cm.get_string(idx)
+    cached = perf_counter() - start
+    print("ClassManager.get_string: %d strings" % len(lookups))
+    print("  first lookup  : %.3fs" % first)
+    print("  cached lookup : %.3fs" % cached)
+
+
+if __name__ == "__main__":
+    main()
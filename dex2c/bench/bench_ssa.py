@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for the SSA construction of large methods.
+
+Builds the SSA form (:func:`construct` and :meth:`IrBuilder.build`) of the
+largest methods of an apk, with the use lists of :class:`Value` kept as a
+dict keyed by user and with the legacy set of :class:`Use`, which was
+scanned on every add_user and rebuilt on every remove_user.
+
+Run from the dex2c directory:
+
+    python3 bench/bench_ssa.py -i example.apk -m 20
+"""
+import argparse
+import re
+import sys
+import tracemalloc
+from os import path
+from time import perf_counter
+from zipfile import ZipFile
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from androguard.core.analysis import analysis
+from androguard.core.bytecodes import dvm
+from dex2c import instruction
+from dex2c.compiler import IrBuilder
+from dex2c.graph import construct
+
+
+class LegacyUses(object):
+    """
+    Value methods using a set of Use, as before.
+    """
+
+    def __init__(self):
+        self.var_type = None
+        self.type_sealed = False
+
+        self.definition = None
+        self.uses = set()
+        self.is_const = False
+
+    def get_uses(self):
+        return self.uses
+
+    def get_users(self):
+        users = set()
+        for use in self.uses:
+            users.add(use.get_user())
+        return list(users)
+
+    def add_user(self, instr):
+        for use in self.uses:
+            if use.get_user() == instr:
+                return
+        else:
+            use = instruction.Use(self, instr)
+            self.uses.add(use)
+
+    def remove_user(self, user):
+        new_uses = set()
+        for use in self.uses:
+            if user != use.get_user():
+                new_uses.add(use)
+        self.uses = new_uses
+
+    def replace_all_uses_with(self, new_value):
+        for use in self.uses:
+            user = use.get_user()
+            user.replase_use_of_with(use.get_value(), new_value)
+        self.uses.clear()
+
+
+PATCHED = ('__init__', 'get_uses', 'get_users', 'add_user', 'remove_user', 'replace_all_uses_with')
+
+
+def use_legacy(enable, saved={}):
+    if enable:
+        for name in PATCHED:
+            saved[name] = getattr(instruction.Value, name)
+            setattr(instruction.Value, name, getattr(LegacyUses, name))
+    else:
+        for name in PATCHED:
+            setattr(instruction.Value, name, saved[name])
+
+
+def load_methods(apk, count):
+    zip_file = ZipFile(apk)
+    vmx = analysis.Analysis()
+    methods = []
+    for name in zip_file.namelist():
+        if re.match("classes(\\d*).dex", name):
+            vm = dvm.DalvikVMFormat(zip_file.read(name))
+            vmx.add(vm)
+            methods.extend(m for m in vm.get_methods() if m.get_code())
+    methods.sort(key=lambda m: m.get_code().get_insns_size(), reverse=True)
+    return vmx, methods[:count]
+
+
+def build(vmx, methods):
+    irbuilders = []
+    for method in methods:
+        irbuilder = IrBuilder(vmx.get_method(method), False, False)
+        irbuilder.graph = construct(irbuilder.start_block)
+        irbuilder.build()
+        irbuilders.append(irbuilder)
+    return irbuilders
+
+
+def get_phis(irbuilders):
+    return [sorted(str(phi) for node in z.graph.nodes for phi in node.phis) for z in irbuilders]
+
+
+def run(vmx, methods, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        build(vmx, methods)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    irbuilders = build(vmx, methods)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return best, size, get_phis(irbuilders)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", default="example.apk", help="Input apk file path")
+    parser.add_argument("-m", "--methods", type=int, default=20, help="Number of methods, the largest ones are used")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    vmx, methods = load_methods(args.input, args.methods)
+    print("%d methods, %d code units" % (len(methods), sum(m.get_code().get_insns_size() for m in methods)))
+
+    use_legacy(True)
+    try:
+        legacy, legacy_size, legacy_phis = run(vmx, methods, args.repeat)
+    finally:
+        use_legacy(False)
+    current, size, phis = run(vmx, methods, args.repeat)
+    assert legacy_phis == phis, "SSA form mismatch"
+
+    print("  legacy uses : %.3fs, %d KiB" % (legacy, legacy_size // 1024))
+    print("  Value.uses  : %.3fs, %d KiB" % (current, size // 1024))
+    print("  speedup     : %.2fx" % (legacy / current))
+
+
+if __name__ == "__main__":
+    main()
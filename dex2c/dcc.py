@@ -2,15 +2,16 @@
 # -*- coding: utf-8 -*-
 import argparse
 import re
-from sys import setrecursionlimit
 from json import load
-from io import BytesIO
 from zipfile import ZipFile
 from os import cpu_count, listdir, makedirs, name, path, sep
+from multiprocessing import get_all_start_methods, get_context
 from logging import basicConfig, getLogger, INFO
 from androguard.core.analysis import analysis
 from androguard.core.bytecodes import dvm
-from dex2c.compiler import Dex2C
+from dex2c.cache import MethodCache, get_method_key
+from dex2c.compiler import Dex2C, DEFAULT_PASSES
+from dex2c.writer import ResolveTable
 from dex2c.util import (
     JniLongName,
     get_method_triple,
@@ -26,6 +27,9 @@ from shutil import copy, move, make_archive, rmtree, copytree
 APKEDITOR = "tools/APKEditor.jar"
 MANIFEST_EDITOR = "tools/manifest-editor.jar"
 Logger = getLogger("dcc")
+# Methods are compiled one after another, the analysis of the compiled ones
+# is not needed anymore
+MAX_METHOD_ANALYSIS = 64
 basicConfig(level=INFO)
 
 
@@ -255,9 +259,17 @@ class DCC:
         self.project_dir = args_["source_dir"]
         self.source_archive = args_["project_archive"]
         self.ndk_build = ndk_build_
+        self.jobs = args_["jobs"] or cpu_cnt()
+        self.cache_dir = args_["cache_dir"]
+        disabled_passes = args_["disable_pass"] or []
+        self.passes = [name for name in DEFAULT_PASSES if name not in disabled_passes]
+        self.static_ids = args_["static_ids"]
+        self.resolve_table = args_["resolve_table"]
+        self.string_pool = args_["string_pool"]
         self.dex_files = None
         self.compiled_methods = None
         self.method_prototypes = None
+        self.method_table_refs = None
 
     def build_project(self):
         check_call(
@@ -380,16 +392,21 @@ class DCC:
         source_dir = path.join(self.project_dir, "jni", "nc")
         if not path.exists(source_dir):
             makedirs(source_dir)
+        resolve_table = ResolveTable(self.obfus)
         for method_triple, code in self.compiled_methods.items():
             full_name = JniLongName(*method_triple)
             filepath = path.join(source_dir, full_name) + ".cpp"
             if path.exists(filepath):
                 Logger.warning(" Overwrite file %s %s" % (filepath, method_triple))
+            defines = resolve_table.get_defines(self.method_table_refs[method_triple])
             try:
                 with open(filepath, "w", encoding="utf-8") as fp:
-                    fp.write('#include "Dex2C.h"\n' + code)
+                    fp.write('#include "Dex2C.h"\n' + defines + code)
             except Exception as e:
                 print(f"{str(e)}\n")
+        # Written even when empty, the runtime links against it
+        with open(path.join(source_dir, "ResolveTable.cpp"), "w", encoding="utf-8") as fp:
+            fp.write(resolve_table.get_source())
         with open(path.join(source_dir, "compiled_methods.txt"), "w") as fp:
             fp.write("\n".join(list(map("".join, self.compiled_methods.keys()))))
 
@@ -399,23 +416,34 @@ class DCC:
         return outfile
 
     def compile_dex(self):
+        global _worker_compilers
         Logger.info(" Converting...")
         compiled_method_code, native_method_prototype, errors = None, None, None
-        dex_analysis = analysis.Analysis()
+        dex_analysis = analysis.Analysis(max_methods=MAX_METHOD_ANALYSIS)
         native_method_prototype = {}
         compiled_method_code = {}
+        method_table_refs = {}
         errors = []
         for dex in self.dex_files:
             dex_analysis.add(dex)
-        for dex in self.dex_files:
+        method_cache = MethodCache(self.cache_dir) if self.cache_dir else None
+        compilers = []
+        # (dex index, method index) of the methods to compile
+        tasks = []
+        # names, cache key and cached code of the selected methods
+        selected = []
+        for dex_idx, dex in enumerate(self.dex_files):
             method_filter = MethodFilter(
                 self.filter_cfg,
                 dex,
                 self.skip_synthetic_methods,
                 self.allow_init_methods,
             )
-            compiler = Dex2C(dex, dex_analysis, self.obfus, self.dynamic_register)
-            for m in dex.get_methods():
+            compiler = Dex2C(dex, dex_analysis, self.obfus, self.dynamic_register, self.passes,
+                             self.static_ids, self.resolve_table, self.string_pool)
+            methods = dex.get_methods()
+            compilers.append((compiler, methods))
+            for method_idx, m in enumerate(methods):
                 method_triple = get_method_triple(m)
                 jni_longname = JniLongName(*method_triple)
                 full_name = "".join(method_triple)
@@ -425,19 +453,67 @@ class DCC:
                     )
                     continue
                 if method_filter.should_compile(m):
-                    try:
-                        code = compiler.get_source_method(m)
-                    except Exception as e:
-                        Logger.warning(
-                            " compile method failed:%s (%s)" % (full_name, str(e)),
-                            exc_info=True,
-                        )
-                        errors.append("%s:%s" % (full_name, str(e)))
-                        continue
-                    if code[0]:
-                        compiled_method_code[method_triple] = code[0]
-                        native_method_prototype[jni_longname] = code[1]
-        return compiled_method_code, native_method_prototype, errors
+                    key, cached = None, None
+                    if method_cache:
+                        key = get_method_key(m, self.obfus, self.dynamic_register,
+                                             dex_analysis.get_class_hierarchy(), self.passes,
+                                             self.static_ids, self.resolve_table, self.string_pool)
+                        cached = method_cache.get(key)
+                    if cached is None:
+                        tasks.append((dex_idx, method_idx))
+                    selected.append((method_triple, jni_longname, full_name, key, cached))
+
+        _worker_compilers = compilers
+        try:
+            if self.jobs > 1 and len(tasks) > 1:
+                results = self.compile_methods_parallel(tasks)
+            else:
+                results = map(_compile_method, tasks)
+            results = iter(results)
+            for method_triple, jni_longname, full_name, key, cached in selected:
+                if cached is not None:
+                    code, prototype, table_refs, error = cached + (None,)
+                else:
+                    code, prototype, table_refs, error = next(results)
+                    if method_cache and error is None:
+                        method_cache.put(key, code, prototype, table_refs)
+                if error is not None:
+                    errors.append("%s:%s" % (full_name, error))
+                elif code:
+                    compiled_method_code[method_triple] = code
+                    native_method_prototype[jni_longname] = prototype
+                    method_table_refs[method_triple] = table_refs
+        finally:
+            _worker_compilers = None
+        if method_cache:
+            Logger.info(
+                f" Compile cache: {method_cache.hits} hits, {method_cache.misses} misses"
+            )
+        return compiled_method_code, native_method_prototype, method_table_refs, errors
+
+    def compile_methods_parallel(self, tasks):
+        """
+        Compile the methods of `tasks` with a pool of `self.jobs` processes.
+
+        When processes are forked the workers reuse the dex files and the
+        Analysis of this process, otherwise each worker parses the dex files
+        again. Results are returned in the order of `tasks`.
+        """
+        Logger.info(f" Compiling {len(tasks)} methods with {self.jobs} processes")
+        if "fork" in get_all_start_methods():
+            context = get_context("fork")
+            dex_buffs = None
+        else:
+            context = get_context()
+            dex_buffs = [bytes(dex.get_buff()) for dex in self.dex_files]
+        chunksize = max(1, len(tasks) // (self.jobs * 8))
+        with context.Pool(
+            self.jobs,
+            _init_compile_worker,
+            (dex_buffs, self.obfus, self.dynamic_register, self.passes, self.static_ids,
+             self.resolve_table, self.string_pool),
+        ) as pool:
+            return pool.map(_compile_method, tasks, chunksize)
 
     def get_classes_folders(self):
         folders = listdir(path.join(self.decompiled_dir, "smali"))
@@ -465,10 +541,9 @@ class DCC:
         pattern_abi, replacement_abi = "", ""
         Logger.info(" Reading dex files")
         if self.is_apk:
-            with open(self.input_file, "rb") as f:
-                zip_file = ZipFile(BytesIO(f.read()))
+            zip_file = ZipFile(self.input_file)
             dex_files = [
-                dvm.DalvikVMFormat(zip_file.read(dex))
+                dvm.DalvikVMFormat.from_zip_entry(zip_file, dex, lazy=True)
                 for dex in filter(
                     lambda x: re.compile("classes(\\d*).dex").match(x),
                     zip_file.namelist(),
@@ -502,9 +577,7 @@ class DCC:
                     pattern_abi = re.compile(r"APP_ABI *:=.*\n")
                     replacement_abi = f"APP_ABI := {' '.join(available_abis)}\n"
         else:
-            with open(self.input_file, "rb") as f:
-                dex = f.read()
-            dex_files = [dvm.DalvikVMFormat(dex)]
+            dex_files = [dvm.DalvikVMFormat.from_file(self.input_file, lazy=True)]
             Logger.info(" using abis defined in Application.mk file")
         Logger.info(f" Setting APP_PLATFORM to {self.min_sdk}")
         pattern_platform = re.compile(r"APP_PLATFORM *:=.*\n")
@@ -622,7 +695,7 @@ class DCC:
         if self.is_dex:
             self.min_sdk = get_min_sdk_from_dex(self.api)
         self.dex_files = self.get_dex_files_and_adjust_mk_files()
-        self.compiled_methods, self.method_prototypes, errors = self.compile_dex()
+        self.compiled_methods, self.method_prototypes, self.method_table_refs, errors = self.compile_dex()
         if errors:
             Logger.warning(" ================================")
             Logger.warning("\n ".join(errors))
@@ -778,6 +851,41 @@ class DCC:
             move_unsigned(unsigned_apk, self.out_file)
 
 
+# Dex2C compilers and method lists of the dex files, used by _compile_method
+_worker_compilers = None
+
+
+def _init_compile_worker(dex_buffs, obfus, dynamic_register, passes, static_ids, resolve_table, string_pool):
+    global _worker_compilers
+    if _worker_compilers is not None:
+        # Inherited from the parent process
+        return
+    dex_files = [dvm.DalvikVMFormat(buff, lazy=True) for buff in dex_buffs]
+    dex_analysis = analysis.Analysis(max_methods=MAX_METHOD_ANALYSIS)
+    for dex in dex_files:
+        dex_analysis.add(dex)
+    _worker_compilers = [
+        (Dex2C(dex, dex_analysis, obfus, dynamic_register, passes, static_ids, resolve_table, string_pool),
+         dex.get_methods())
+        for dex in dex_files
+    ]
+
+
+def _compile_method(task):
+    dex_idx, method_idx = task
+    compiler, methods = _worker_compilers[dex_idx]
+    m = methods[method_idx]
+    try:
+        code, prototype, table_refs = compiler.get_source_method(m)
+    except Exception as e:
+        Logger.warning(
+            " compile method failed:%s (%s)" % ("".join(get_method_triple(m)), str(e)),
+            exc_info=True,
+        )
+        return None, None, None, str(e)
+    return code, prototype, table_refs, None
+
+
 def is_windows():
     return name == "nt"
 
@@ -853,7 +961,7 @@ def is_dex(name_):
     pat = re.compile(b"\x64\x65\x78\x0a\x30(\\d\\d)\x00")
     try:
         with open(name_, "rb") as f:
-            magic = f.read()[:8]
+            magic = f.read(8)
         match = pat.match(magic)
         return True, get_api_from_dex(int(match.group(1).decode()))
     except:
@@ -903,7 +1011,6 @@ def restore_jni_project_folder(src_path):
     copytree(src_path, dest_path)
 
 
-setrecursionlimit(5000)
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--input", required=True, help="Input apk/dex file path")
@@ -969,6 +1076,41 @@ if __name__ == "__main__":
         default=None,
         help="The compiled cpp code output directory.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes compiling the methods, 0 for one per cpu, default: 1",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of the cache of the compiled methods, reused by later builds",
+    )
+    parser.add_argument(
+        "--disable-pass",
+        action="append",
+        choices=DEFAULT_PASSES,
+        default=None,
+        help="Disable an optimization pass of the compiled methods, can be repeated",
+    )
+    id_storage = parser.add_mutually_exclusive_group()
+    id_storage.add_argument(
+        "--static-ids",
+        action="store_true",
+        help="Keep the resolved class, method and field IDs in static storage shared by the calls of a method",
+    )
+    id_storage.add_argument(
+        "--resolve-table",
+        action="store_true",
+        help="Resolve the class, method and field IDs once into a global table shared by all the methods",
+    )
+    parser.add_argument(
+        "--string-pool",
+        action="store_true",
+        help="Create each string constant once, in a pool of interned strings shared by all the methods",
+    )
     parser.add_argument(
         "-z",
         "--project-archive",
@@ -8,10 +8,91 @@ from dex2c.opcode_ins import INSTRUCTION_SET
 logger = logging.getLogger('dex2c.basic_blocks')
 
 
+class InstructionList(object):
+    """
+    Doubly linked list of the instructions of a basic block.
+
+    The links are kept in two dicts keyed by instruction, so that inserting
+    an instruction before another one and removing an instruction are O(1).
+    An instruction can only be in one list at a time.
+    """
+
+    def __init__(self, instructions=()):
+        self.__next = {}
+        self.__prev = {}
+        self.__first = None
+        self.__last = None
+        for ins in instructions:
+            self.append(ins)
+
+    def append(self, ins):
+        assert ins not in self.__next, "%s already in the list" % ins
+        self.__prev[ins] = self.__last
+        self.__next[ins] = None
+        if self.__last is None:
+            self.__first = ins
+        else:
+            self.__next[self.__last] = ins
+        self.__last = ins
+
+    def insert_before(self, new_ins, before_ins):
+        assert new_ins not in self.__next, "%s already in the list" % new_ins
+        prev = self.__prev[before_ins]
+        self.__prev[new_ins] = prev
+        self.__next[new_ins] = before_ins
+        self.__prev[before_ins] = new_ins
+        if prev is None:
+            self.__first = new_ins
+        else:
+            self.__next[prev] = new_ins
+
+    def remove(self, ins):
+        prev = self.__prev.pop(ins)
+        next = self.__next.pop(ins)
+        if prev is None:
+            self.__first = next
+        else:
+            self.__next[prev] = next
+        if next is None:
+            self.__last = prev
+        else:
+            self.__prev[next] = prev
+
+    def get_first(self):
+        return self.__first
+
+    def get_last(self):
+        return self.__last
+
+    def get_next(self, ins):
+        return self.__next[ins]
+
+    def get_prev(self, ins):
+        return self.__prev[ins]
+
+    def __iter__(self):
+        # The next instruction is read before yielding the current one, so
+        # the current instruction can be removed during the iteration.
+        ins = self.__first
+        while ins is not None:
+            next = self.__next[ins]
+            yield ins
+            ins = next
+
+    def __contains__(self, ins):
+        return ins in self.__next
+
+    def __len__(self):
+        return len(self.__next)
+
+    def __bool__(self):
+        return self.__first is not None
+
+
 class IrBasicBlock(object):
     def __init__(self, dvm_basicblock):
         self.dvm_basicblock = dvm_basicblock
-        self.instr_list = []
+        self.instr_list = InstructionList()
 
         # MoveParam指令会给参数生成一个局部引用(local reference), 使用局部引用引用参数
         # 不能将它放入instr_list, 因为第一个基本块可以是循环
@@ -48,8 +129,7 @@ class IrBasicBlock(object):
         return self.label
 
     def add_ins_before(self, new_ins, before_ins):
-        pos = self.instr_list.index(before_ins)
-        self.instr_list = self.instr_list[:pos] + [new_ins] + self.instr_list[pos:]
+        self.instr_list.insert_before(new_ins, before_ins)
 
     def remove_ins(self, ins):
         self.instr_list.remove(ins)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from os import path
+
+import androguard
+from androguard.core.bytecodes import dvm
+
+logger = logging.getLogger('dex2c.cache')
+
+# Bump when the format of the cache entries changes
+CACHE_FORMAT = 2
+
+
+def _get_compiler_version():
+    # Any change in the sources of the compiler, or of the parser and the
+    # analysis of androguard it reads the dex files with, may change the
+    # generated code
+    sha = hashlib.sha256(str(CACHE_FORMAT).encode())
+    for package_dir in (path.dirname(path.abspath(__file__)), path.dirname(path.abspath(androguard.__file__))):
+        for root, dirs, files in os.walk(package_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    filepath = path.join(root, name)
+                    with open(filepath, 'rb') as fp:
+                        sha.update(path.relpath(filepath, path.dirname(package_dir)).encode())
+                        sha.update(fp.read())
+    return sha.hexdigest()
+
+
+COMPILER_VERSION = _get_compiler_version()
+
+# The class types of a type descriptor, of its elements for an array
+CLASS_TYPE = re.compile(r'L[^;]+;')
+
+
+def _get_class_types(kind, ref):
+    """
+    Return the class types named by the reference `ref` of an instruction,
+    as given by get_translated_kind
+    """
+    if kind == dvm.KIND_TYPE:
+        return CLASS_TYPE.findall(ref)
+    # Lclass;->name(params)return or Lclass;->name type
+    class_name, member = ref.split('->', 1)
+    if kind == dvm.KIND_METH:
+        descriptor = member[member.index('('):]
+    else:
+        descriptor = member.split(' ', 1)[1]
+    return [class_name] + CLASS_TYPE.findall(descriptor)
+
+
+def get_method_key(method, obfus, dynamic_register, hierarchy=None, passes=(), static_ids=False,
+                   resolve_table=False, string_pool=False):
+    """
+    Return the cache key of a method.
+
+    The key covers everything the compiler reads: the signature and access
+    flags of the method, its code item, and the names of the strings, types,
+    fields and methods it references (their indexes change from a build to
+    another), plus the compiler flags and version. The types inferred for
+    the method depend on the class hierarchy too: when `hierarchy` is given,
+    the digest of the supertypes of the class types the method references
+    is part of the key, the other classes of the app do not change it.
+    """
+    cm = method.CM
+    key = [COMPILER_VERSION, obfus, dynamic_register, list(passes), static_ids, resolve_table,
+           string_pool, method.get_triple(), method.get_access_flags()]
+    class_types = {method.get_class_name()}
+    class_types.update(CLASS_TYPE.findall(method.get_descriptor()))
+
+    code = method.get_code()
+    if code:
+        bc = code.get_bc()
+        key.append((code.get_registers_size(), code.get_ins_size(),
+                    code.get_outs_size(), bytes(bc.get_insn())))
+
+        for ins in bc.get_instructions():
+            if not isinstance(ins, dvm.Instruction):
+                # payload of fill-array-data or of a switch
+                continue
+            try:
+                kind = ins.get_kind()
+            except IndexError:
+                # the format of the opcode has no reference
+                continue
+            if kind in (dvm.KIND_METH, dvm.KIND_STRING, dvm.KIND_FIELD,
+                        dvm.KIND_TYPE, dvm.KIND_RAW_STRING):
+                ref = ins.get_translated_kind()
+                key.append(ref)
+                if kind in (dvm.KIND_METH, dvm.KIND_FIELD, dvm.KIND_TYPE):
+                    class_types.update(_get_class_types(kind, ref))
+
+        key.append([(t.get_start_addr(), t.get_insn_count(), t.get_handler_off())
+                    for t in code.get_tries()])
+        handlers = code.get_handlers()
+        if handlers:
+            for h in handlers.get_list():
+                catches = [(cm.get_type(p.get_type_idx()), p.get_addr()) for p in h.get_handlers()]
+                key.append((h.get_off() - handlers.get_off(), h.get_size(), catches,
+                            h.get_catch_all_addr() if h.get_size() <= 0 else None))
+                class_types.update(atype for atype, _ in catches)
+
+    if hierarchy is not None:
+        key.append(hierarchy.get_digest(sorted(class_types)))
+
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+class MethodCache(object):
+    """
+    On-disk cache of the code generated for the methods, see
+    :func:`get_method_key`.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _get_path(self, key):
+        return path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, key):
+        """
+        Return the (code, prototype, table references) stored for `key`, or
+        None
+        """
+        try:
+            with open(self._get_path(key), encoding='utf-8') as fp:
+                code, prototype, table_refs = json.load(fp)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return code, prototype, [tuple(ref) for ref in table_refs]
+
+    def put(self, key, code, prototype, table_refs):
+        filepath = self._get_path(key)
+        tmp_path = '%s.%d.tmp' % (filepath, os.getpid())
+        try:
+            os.makedirs(path.dirname(filepath), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump([code, prototype, table_refs], fp)
+            os.replace(tmp_path, filepath)
+        except OSError as e:
+            logger.warning('Can not write cache entry %s: %s', filepath, e)
@@ -1,12 +1,15 @@
 from dex2c.basic_blocks import fill_node_from_block
 
+import heapq
 import logging
 from collections import defaultdict
 import dex2c.util as util
 from androguard.core.analysis import analysis
 from dex2c.graph import construct
-from dex2c.instruction import Param, ThisParam, MoveParam, Phi, Variable, LoadConstant
-from dex2c.writer import Writer
+from dex2c.instruction import Param, ThisParam, MoveParam, Phi, Variable, LoadConstant, Constant, Instruction, \
+    MoveExpression, BinaryExpression, BinaryCompExpression, UnaryExpression, CastExpression, InvokeInstruction
+from dex2c.opcode_ins import Op
+from dex2c.writer import Writer, get_intrinsic, is_redundant_cast
 
 DEBUG = False
 # DEBUG = True
@@ -34,6 +37,431 @@ class RegisterAllocator(object):
         return self.slots[(register, atype)]
 
 
+def get_slot(var):
+    """
+    Return the (register, C type) slot of a variable, i.e. what
+    RegisterAllocator maps to a C local
+    """
+    return var.get_register(), util.get_cdecl_type(var.get_type())
+
+
+class SlotLiveness(object):
+    """
+    Live slots at the start of the blocks of a graph.
+
+    A slot live at the start of a catch handler is live in the whole blocks
+    which can throw to it, since the exception can be raised by any of their
+    instructions. The move-param instructions of the entry block are left
+    out: they are not on the back edges.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = graph.compute_block_order()
+        # node -> [(defs, uses)] of its instructions
+        self.def_use = {}
+        self.live_in = {}
+        self.compute()
+
+    @staticmethod
+    def get_def_use(ins):
+        value = ins.get_value()
+        defs = [get_slot(value)] if isinstance(value, Variable) else []
+        uses = [get_slot(operand) for operand in ins.operands if isinstance(operand, Variable)]
+        return defs, uses
+
+    def get_catch_live(self, node):
+        catch_live = set()
+        for handler in self.graph.all_catches(node):
+            catch_live.update(self.live_in.get(handler, ()))
+        return catch_live
+
+    def get_live_out(self, node):
+        live_out = set()
+        for suc in self.graph.all_sucs(node):
+            live_out.update(self.live_in.get(suc, ()))
+        return live_out
+
+    def compute(self):
+        graph = self.graph
+        nodes = self.nodes
+        gen = {}
+        kill = {}
+        for node in nodes:
+            self.def_use[node] = [self.get_def_use(ins) for ins in node.get_instr_list()]
+            gen[node] = node_gen = set()
+            kill[node] = node_kill = set()
+            for defs, uses in self.def_use[node]:
+                node_gen.update(slot for slot in uses if slot not in node_kill)
+                node_kill.update(defs)
+
+        live_in = self.live_in
+        for node in nodes:
+            live_in[node] = set()
+
+        # backward problem, start with the last blocks
+        todo = list(nodes)
+        queued = set(todo)
+        while todo:
+            node = todo.pop()
+            queued.discard(node)
+            new_live_in = gen[node] | (self.get_live_out(node) - kill[node]) | self.get_catch_live(node)
+            if new_live_in != live_in[node]:
+                live_in[node] = new_live_in
+                for pred in graph.all_preds(node):
+                    if pred in live_in and pred not in queued:
+                        todo.append(pred)
+                        queued.add(pred)
+
+
+class TypeInference(object):
+    """
+    Sparse fixpoint of the resolve_type() of the phis and instructions.
+
+    The items are evaluated in rounds, in the order of `nodes`, like a loop
+    over all of them until a round changes no type. An item is only evaluated
+    again when the type of one of the values it reads or writes changed since
+    its last evaluation, evaluating the other ones would change nothing.
+    """
+
+    def __init__(self, nodes):
+        # (item, values read or written by its resolve_type())
+        self.items = []
+        # value -> position of the items using it
+        self.value_items = defaultdict(list)
+        for node in nodes:
+            for phi in node.phis:
+                self.add_item(phi, [phi] + list(phi.get_operands().values()))
+            for ins in node.get_instr_list():
+                values = list(ins.operands)
+                if ins.value is not None:
+                    values.append(ins.value)
+                self.add_item(ins, values)
+        # items to evaluate in the next round
+        self.dirty = set(range(len(self.items)))
+        self.rounds = 0
+        self.evaluations = 0
+
+    def add_item(self, item, values):
+        pos = len(self.items)
+        values = list(dict.fromkeys(values))
+        self.items.append((item, values))
+        for value in values:
+            self.value_items[value].append(pos)
+
+    def add_values(self, values):
+        """
+        Evaluate again the items using `values` on the next run
+        """
+        for value in values:
+            self.dirty.update(self.value_items.get(value, ()))
+
+    def run(self):
+        changed = True
+        while changed:
+            self.rounds += 1
+            # Every round changes a type, which can only be refined a few
+            # times: a longer run means the types oscillate
+            if self.rounds > 500 + 8 * len(self.items):
+                raise Exception("type infer failed")
+            # In a round, the items after the current one are evaluated in
+            # the same round, as a loop over all the items would do.
+            todo = sorted(self.dirty)
+            queued = set(todo)
+            self.dirty = set()
+            changed = False
+            while todo:
+                pos = heapq.heappop(todo)
+                queued.discard(pos)
+                item, values = self.items[pos]
+                before = [(v.var_type, v.type_sealed) for v in values]
+                changed |= item.resolve_type()
+                self.evaluations += 1
+                for value, state in zip(values, before):
+                    if (value.var_type, value.type_sealed) == state:
+                        continue
+                    for user in self.value_items[value]:
+                        if user <= pos:
+                            self.dirty.add(user)
+                        elif user not in queued:
+                            heapq.heappush(todo, user)
+                            queued.add(user)
+
+
+class OptimizationPass(object):
+    """
+    Pass over the SSA form of a method, run by PassManager once the types
+    are inferred.
+
+    The SSA values of a register with the same C type share a C local and
+    the phis are implicit, so the passes leave the phis alone and never
+    remove the definition of a slot which an exception handler of the block
+    may read.
+    """
+    name = None
+
+    def __init__(self, graph, liveness):
+        self.graph = graph
+        self.liveness = liveness
+        self.catch_live = {}
+
+    def get_catch_live(self, node):
+        if node not in self.catch_live:
+            self.catch_live[node] = self.liveness.get_catch_live(node)
+        return self.catch_live[node]
+
+    def replace_ins(self, ins, new_ins):
+        node = ins.parent
+        new_ins.parent = node
+        new_ins.offset = ins.offset
+        new_ins.next_offset = ins.next_offset
+        new_ins.dvm_instr = ins.dvm_instr
+        new_ins.get_value().definition = new_ins
+        node.add_ins_before(new_ins, ins)
+        self.remove_ins(ins)
+
+    @staticmethod
+    def remove_ins(ins):
+        for operand in ins.operands:
+            operand.remove_user(ins)
+        ins.parent.remove_ins(ins)
+
+    def run(self):
+        """
+        Return True when the method was changed, the base pass changes
+        nothing
+        """
+        return False
+
+
+def to_signed(value, bits):
+    value &= (1 << bits) - 1
+    if value >> (bits - 1):
+        value -= 1 << bits
+    return value
+
+
+def java_div(a, b):
+    # division of java, truncated toward zero
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+FOLD_OPS = {
+    Op.ADD: lambda a, b: a + b,
+    Op.SUB: lambda a, b: a - b,
+    Op.MUL: lambda a, b: a * b,
+    Op.DIV: lambda a, b: java_div(a, b),
+    Op.MOD: lambda a, b: a - java_div(a, b) * b,
+    Op.AND: lambda a, b: a & b,
+    Op.OR: lambda a, b: a | b,
+    Op.XOR: lambda a, b: a ^ b,
+    Op.INTSHL: lambda a, b: a << (b & 0x1f),
+    Op.INTSHR: lambda a, b: a >> (b & 0x1f),
+    Op.INTUSHR: lambda a, b: (a & 0xffffffff) >> (b & 0x1f),
+    Op.LONGSHL: lambda a, b: a << (b & 0x3f),
+    Op.LONGSHR: lambda a, b: a >> (b & 0x3f),
+    Op.LONGUSHR: lambda a, b: (a & 0xffffffffffffffff) >> (b & 0x3f),
+}
+
+
+def fold_binary(op, arg1, arg2, bits):
+    """
+    Evaluate the int (32 bits) or long (64 bits) operation `op` of java on
+    two signed constants
+
+    >>> fold_binary(Op.DIV, -2 ** 31, -1, 32), fold_binary(Op.MOD, -2 ** 31, -1, 32)
+    (-2147483648, 0)
+    >>> fold_binary(Op.DIV, -7, 2, 32), fold_binary(Op.MOD, 7, -3, 32), fold_binary(Op.MOD, -7, 3, 32)
+    (-3, 1, -1)
+    >>> fold_binary(Op.INTSHL, 1, 33, 32), fold_binary(Op.INTUSHR, -1, 60, 32), fold_binary(Op.INTSHR, -8, -31, 32)
+    (2, 15, -4)
+    >>> fold_binary(Op.LONGSHL, 1, 65, 64), fold_binary(Op.LONGUSHR, -1, 63, 64), fold_binary(Op.ADD, 2 ** 31 - 1, 1, 32)
+    (2, 1, -2147483648)
+    """
+    return to_signed(FOLD_OPS[op](arg1, arg2), bits)
+
+
+class ConstantFolding(OptimizationPass):
+    """
+    Replace the int and long arithmetic on constants by the constant it
+    evaluates to, with the overflow and the division of java. The float
+    constants are kept as raw bits, they are not folded, nor the divisions
+    by zero which throw.
+    """
+    name = 'constant-folding'
+
+    def get_constant(self, value):
+        if isinstance(value, Constant):
+            cst = value
+        elif isinstance(value.definition, LoadConstant) and value.definition.parent is not None:
+            cst = value.definition.get_cst()
+        else:
+            return None
+        atype = value.get_type()
+        if atype is None or not (util.is_int(atype) or util.is_long(atype)):
+            return None
+        cst = cst.get_constant()
+        if not isinstance(cst, int):
+            return None
+        return to_signed(cst, 64 if util.is_long(atype) else 32)
+
+    def fold(self, ins):
+        if ins.op_type not in ('I', 'J') or ins.op not in FOLD_OPS \
+                or isinstance(ins, BinaryCompExpression):
+            return None
+        arg1, arg2 = [self.get_constant(operand) for operand in ins.operands]
+        if arg1 is None or arg2 is None:
+            return None
+        if ins.op in (Op.DIV, Op.MOD) and arg2 == 0:
+            return None
+        bits = 64 if ins.op_type == 'J' else 32
+        value = fold_binary(ins.op, arg1, arg2, bits)
+        if value == -(1 << 63):
+            # not a valid literal of C
+            return None
+        return value
+
+    def run(self):
+        changed = False
+        for node in self.graph.compute_block_order():
+            for ins in node.get_instr_list():
+                if not isinstance(ins, BinaryExpression):
+                    continue
+                value = self.fold(ins)
+                if value is None:
+                    continue
+                logger.debug("Fold %s to %s" % (ins, value))
+                self.replace_ins(ins, LoadConstant(ins.get_value(), Constant(value, ins.op_type)))
+                changed = True
+        return changed
+
+
+class CopyPropagation(OptimizationPass):
+    """
+    Replace the uses of the destination of a move by its source, so that the
+    move becomes dead. Only the moves read in their own block and not by a
+    phi are propagated, as long as the register of the source is not written
+    again before the last use: the users then read the C local of the source.
+    """
+    name = 'copy-propagation'
+
+    def run(self):
+        changed = False
+        for node in self.graph.compute_block_order():
+            instrs = list(node.get_instr_list())
+            position = {ins: pos for pos, ins in enumerate(instrs)}
+            for pos, ins in enumerate(instrs):
+                if type(ins) is not MoveExpression:
+                    continue
+                lhs = ins.get_value()
+                rhs = ins.operands[0]
+                if not isinstance(rhs, Variable) or lhs.get_register() < 0 or rhs.get_register() < 0 \
+                        or lhs.get_type() != rhs.get_type():
+                    continue
+                if get_slot(lhs) in self.get_catch_live(node):
+                    continue
+                users = lhs.get_users()
+                if not users or any(user not in position or position[user] <= pos for user in users):
+                    continue
+                # A user writing the register of the source would delete the
+                # local reference it reads.
+                rhs_slot = get_slot(rhs)
+                last = max(position[user] for user in users)
+                if any(isinstance(instrs[i].get_value(), Variable) and get_slot(instrs[i].get_value()) == rhs_slot
+                       for i in range(pos + 1, last + 1)):
+                    continue
+                logger.debug("Propagate %s" % ins)
+                lhs.replace_all_uses_with(rhs)
+                changed = True
+        return changed
+
+
+class DeadCodeElimination(OptimizationPass):
+    """
+    Remove the instructions without side effect whose value is not used.
+    """
+    name = 'dead-code-elimination'
+
+    @staticmethod
+    def is_removable(ins):
+        if type(ins) is LoadConstant:
+            # const-class can throw
+            return ins.get_class() is None
+        if type(ins) is MoveExpression:
+            return True
+        if isinstance(ins, BinaryExpression):
+            # division by zero throws
+            return ins.op not in (Op.DIV, Op.MOD) or ins.op_type in ('F', 'D')
+        if isinstance(ins, InvokeInstruction):
+            # the lowered Math, Float and Double methods are pure
+            intrinsic = get_intrinsic(ins)
+            return intrinsic is not None and not intrinsic[1]
+        return isinstance(ins, (UnaryExpression, CastExpression))
+
+    def is_dead(self, ins):
+        value = ins.get_value()
+        return isinstance(value, Variable) and value.use_empty() and value.get_register() >= 0 \
+            and self.is_removable(ins) and get_slot(value) not in self.get_catch_live(ins.parent)
+
+    def run(self):
+        todo = []
+        for node in self.graph.compute_block_order():
+            for ins in node.get_instr_list():
+                if self.is_dead(ins):
+                    todo.append(ins)
+
+        changed = False
+        while todo:
+            ins = todo.pop()
+            if ins.parent is None or ins not in ins.parent.get_instr_list():
+                # already removed
+                continue
+            logger.debug("Remove %s" % ins)
+            self.remove_ins(ins)
+            ins.parent = None
+            changed = True
+            for operand in ins.operands:
+                definition = operand.definition
+                if isinstance(definition, Instruction) and definition.parent is not None \
+                        and definition.get_value() is operand and self.is_dead(definition):
+                    todo.append(definition)
+        return changed
+
+
+OPTIMIZATION_PASSES = [ConstantFolding, CopyPropagation, DeadCodeElimination]
+
+DEFAULT_PASSES = [cls.name for cls in OPTIMIZATION_PASSES]
+
+
+class PassManager(object):
+    """
+    Run the optimization passes named in `passes` on the SSA form of a
+    method until none of them changes it.
+    """
+
+    def __init__(self, graph, passes=DEFAULT_PASSES):
+        self.graph = graph
+        unknown = set(passes) - set(DEFAULT_PASSES)
+        if unknown:
+            raise ValueError("unknown optimization passes %s" % ', '.join(sorted(unknown)))
+        self.passes = [cls for cls in OPTIMIZATION_PASSES if cls.name in passes]
+        self.rounds = 0
+
+    def run(self):
+        if not self.passes:
+            return
+        # The passes only shrink the liveness of the slots, it is computed once
+        liveness = SlotLiveness(self.graph)
+        passes = [cls(self.graph, liveness) for cls in self.passes]
+        changed = True
+        while changed:
+            self.rounds += 1
+            changed = False
+            for opt in passes:
+                changed |= opt.run()
+
+
 class IrMethod(object):
     def __init__(self, graph, method):
         self.method = method
@@ -67,12 +495,18 @@ class IrMethod(object):
             return self.writer.get_prototype()
         return ''
 
+    def get_table_refs(self):
+        if self.writer:
+            return self.writer.get_table_refs()
+        return []
+
     def __repr__(self):
         return "class IrMethod(object): %s" % self.name
 
 
 class IrBuilder(object):
-    def __init__(self, methanalysis, obfus, dynamic_register):
+    def __init__(self, methanalysis, obfus, dynamic_register, passes=DEFAULT_PASSES, static_ids=False,
+                 resolve_table=False, string_pool=False):
         method = methanalysis.get_method()
         self.method = method
         self.irmethod = None
@@ -84,6 +518,10 @@ class IrBuilder(object):
         self.offset_to_node = {}
         self.graph = None
         self.dynamic_register = dynamic_register
+        self.passes = passes
+        self.static_ids = static_ids
+        self.resolve_table = resolve_table
+        self.string_pool = string_pool
 
         self.access = util.get_access_method(method.get_access_flags())
 
@@ -96,6 +534,7 @@ class IrBuilder(object):
         self.curret_block = None
 
         self.var_versions = defaultdict(int)
+        self.type_inference = None
         
         self.obfus = obfus
 
@@ -131,7 +570,8 @@ class IrBuilder(object):
         irmethod.params = self.lparams
         irmethod.params_type = self.params_type
 
-        writer = Writer(irmethod, self.dynamic_register)
+        writer = Writer(irmethod, self.dynamic_register, self.static_ids, self.resolve_table,
+                        self.string_pool)
         writer.write_method()
         irmethod.writer = writer
         return irmethod
@@ -160,18 +600,48 @@ class IrBuilder(object):
         self.verify_operand_type()
         self.verify_phi_operand_type()
 
+        self.optimize()
+
         # self.dump_type()
 
         self.add_var_to_decl()
 
     def remove_trivial_phi(self):
-        Changed = True
-        while Changed:
-            Changed = False
-            for node in self.graph.rpo:
-                phis = list(node.phis)
-                for phi in phis:
-                    Changed |= phi.remove_trivial_phi()
+        # A phi which is not trivial only becomes trivial when one of its
+        # operands is replaced, i.e. when a phi it uses is removed. The phis
+        # are checked in rounds, in the order of a loop over self.graph.rpo
+        # until nothing changes, but only the affected ones are checked again.
+        phis = [phi for node in self.graph.rpo for phi in list(node.phis)]
+        position = {phi: pos for pos, phi in enumerate(phis)}
+        dirty = set(range(len(phis)))
+        while dirty:
+            todo = sorted(dirty)
+            queued = set(todo)
+            dirty = set()
+            while todo:
+                pos = heapq.heappop(todo)
+                queued.discard(pos)
+                phi = phis[pos]
+                if phi.get_block() is None or phi not in phi.get_block().phis:
+                    # already removed
+                    continue
+                users = [user for user in phi.get_users() if isinstance(user, Phi) and user is not phi]
+                if not phi.remove_trivial_phi():
+                    continue
+                for user in users:
+                    user_pos = position.get(user)
+                    if user_pos is None:
+                        continue
+                    if user_pos <= pos:
+                        dirty.add(user_pos)
+                    elif user_pos not in queued:
+                        heapq.heappush(todo, user_pos)
+                        queued.add(user_pos)
+
+    def optimize(self):
+        pass_manager = PassManager(self.graph, self.passes)
+        pass_manager.run()
+        logger.debug("optimization of %s: %d rounds" % (self.name, pass_manager.rounds))
 
     def verify_operand_type(self):
         nodes = self.graph.compute_block_order()
@@ -210,33 +680,24 @@ class IrBuilder(object):
             for ins in node.get_instr_list():
                 if isinstance(ins, LoadConstant) and ins.get_value_type() is None:
                     todo_list.append(ins)
-        while todo_list:
-            ins = todo_list.pop(0)
+        for ins in todo_list:
             bb = ins.parent
             for user in ins.get_users():
                 new_val = self.write_variable(ins.get_value().get_register())
                 new_ins = LoadConstant(new_val, ins.get_cst())
+                new_ins.parent = bb
+                new_val.definition = new_ins
                 bb.add_ins_before(new_ins, ins)
                 # 每处引用不同的常量拷贝,解决常量多态问题.如0,可以当NULL,整型0,false使用.
                 user.replase_use_of_with(ins.get_value(), new_val)
             ins.parent.remove_ins(ins)
 
     def infer_type(self):
-        Changed = True
-        nodes = self.graph.compute_block_order()
-        max = 500
-        while Changed:
-            # self.dump_type()
-            max -= 1
-            if max == 0:
-                raise Exception("type infer failed")
-
-            Changed = False
-            for node in nodes:
-                for phi in node.phis:
-                    Changed |= phi.resolve_type()
-                for ins in node.get_instr_list():
-                    Changed |= ins.resolve_type()
+        if self.type_inference is None:
+            self.type_inference = TypeInference(self.graph.compute_block_order())
+        self.type_inference.run()
+        logger.debug("type inference of %s: %d rounds, %d evaluations" % (
+            self.name, self.type_inference.rounds, self.type_inference.evaluations))
 
     # 无法推导出的常量类型,根据其大小,设置类型
     def fix_const_type(self):
@@ -253,6 +714,7 @@ class IrBuilder(object):
                         Changed = True
                         logger.debug("Set constant type to long: %s" % ins)
                         ins.set_value_type("J")
+                    self.type_inference.add_values([ins.get_value()])
 
         if Changed:
             self.infer_type()
@@ -274,6 +736,10 @@ class IrBuilder(object):
                 if var is not None:
                     entry.var_to_declare.append(var)
 
+                if get_intrinsic(ins) is not None or is_redundant_cast(ins):
+                    # lowered to a C expression or not emitted, no ID to resolve
+                    continue
+
                 clz = ins.get_class()
                 if clz:
                     entry.class_to_declare.append(clz)
@@ -338,23 +804,57 @@ class IrBuilder(object):
             return value
 
     def read_variable_recursive(self, register, block):
-        preds = self.graph.all_preds(block)
-        if not block.sealed:
-            value = self.new_ssa_variable(register, True)
-            block.add_incomplete_phi(value)
-            value.set_block(block)
-        elif len(preds) == 1:
-            value = self.read_variable(register, preds[0])
-        else:
-            value = self.new_ssa_variable(register, True)
-            block.update_current_definition(register, value)
-            block.add_phi(value)
-            value.set_block(block)
-            for pred in preds:
-                incoming = self.read_variable(register, pred)
-                value.add_operand(pred, incoming)
-        block.update_current_definition(register, value)
-        return value
+        """
+        Look up the definition of `register` through the predecessors of
+        `block`, creating the phis needed on the way.
+
+        The lookup of the predecessors is done with an explicit stack, so
+        that long chains of blocks do not exhaust the Python stack. Each
+        frame is (block, phi, preds, index of the pred being looked up),
+        phi being None for the sealed blocks with a single predecessor.
+        """
+        stack = []
+        while True:
+            value = block.read_current_definition(register)
+            if value is None:
+                preds = self.graph.all_preds(block)
+                if not block.sealed:
+                    value = self.new_ssa_variable(register, True)
+                    block.add_incomplete_phi(value)
+                    value.set_block(block)
+                    block.update_current_definition(register, value)
+                elif len(preds) == 1:
+                    stack.append((block, None, preds, 0))
+                    block = preds[0]
+                    continue
+                else:
+                    value = self.new_ssa_variable(register, True)
+                    block.update_current_definition(register, value)
+                    block.add_phi(value)
+                    value.set_block(block)
+                    if preds:
+                        stack.append((block, value, preds, 0))
+                        block = preds[0]
+                        continue
+                    # the entry or an unreachable block: a phi without
+                    # operands, as the predecessors define nothing
+
+            # value is the definition found for the block on top of the stack
+            while stack:
+                block, phi, preds, idx = stack.pop()
+                if phi is None:
+                    block.update_current_definition(register, value)
+                    continue
+                phi.add_operand(preds[idx], value)
+                idx += 1
+                if idx < len(preds):
+                    stack.append((block, phi, preds, idx))
+                    block = preds[idx]
+                    break
+                block.update_current_definition(register, phi)
+                value = phi
+            else:
+                return value
 
     def define_params(self):
         entry = self.graph.entry
@@ -364,7 +864,8 @@ class IrBuilder(object):
             if "static" not in self.access:
                 param = self.new_ssa_variable(start)
                 param.set_type(self.cls_name)
-                entry.move_param_insns.append(MoveParam(ThisParam(param)))
+                param.definition = MoveParam(ThisParam(param))
+                entry.move_param_insns.append(param.definition)
                 entry.update_current_definition(start, param)
                 entry.var_to_declare.append(param)
                 start += 1
@@ -373,7 +874,8 @@ class IrBuilder(object):
                 register = start + num_param
                 param = self.new_ssa_variable(register)
                 param.set_type(ptype)
-                entry.move_param_insns.append(MoveParam(Param(param)))
+                param.definition = MoveParam(Param(param))
+                entry.move_param_insns.append(param.definition)
                 entry.update_current_definition(register, param)
                 entry.var_to_declare.append(param)
                 num_param += util.get_type_size(ptype)
@@ -462,21 +964,28 @@ class DvClass(object):
 
 
 class Dex2C:
-    def __init__(self, vm, vmx, obfus, dynamic_register):
+    def __init__(self, vm, vmx, obfus, dynamic_register, passes=DEFAULT_PASSES, static_ids=False,
+                 resolve_table=False, string_pool=False):
         self.vm = vm
         self.vmx = vmx
         self.obfus = obfus
         self.dynamic_register = dynamic_register
+        self.passes = passes
+        self.static_ids = static_ids
+        self.resolve_table = resolve_table
+        self.string_pool = string_pool
+        util.set_class_hierarchy(vmx.get_class_hierarchy())
         
 
     def get_source_method(self, m):
         mx = self.vmx.get_method(m)
-        z = IrBuilder(mx, self.obfus, self.dynamic_register)
+        z = IrBuilder(mx, self.obfus, self.dynamic_register, self.passes, self.static_ids, self.resolve_table,
+                      self.string_pool)
         irmethod = z.process()
         if irmethod:
-            return (irmethod.get_source(), irmethod.get_prototype())
+            return (irmethod.get_source(), irmethod.get_prototype(), irmethod.get_table_refs())
         else:
-            return (None, None)
+            return (None, None, [])
 
     def get_source_class(self, _class):
         c = DvClass(_class, self.vmx)
@@ -10,9 +10,12 @@ class Graph(object):
     def __init__(self):
         self.entry = None
         self.exit = None
-        self.nodes = list()
+        # The nodes are the keys of a dict, an ordered set from which a node
+        # is removed in constant time.
+        self.nodes = {}
         self.landing_pads = list()
-        self.rpo = []
+        self.__rpo = []
+        self.__rpo_removed = False
         self.edges = defaultdict(list)
         self.catch_edges = defaultdict(list)
         self.reverse_edges = defaultdict(list)
@@ -21,12 +24,35 @@ class Graph(object):
         self.loc_to_node = None
         self.offset_to_node = {}
         self.node_to_landing_pad = {}
+        # Caches of all_sucs, all_preds and compute_block_order, reset when
+        # the graph is modified. The cached lists are never modified in
+        # place, so callers can keep them while changing the graph.
+        self.__all_sucs = {}
+        self.__all_preds = {}
+        self.__block_order = None
+
+    @property
+    def rpo(self):
+        # remove_node does not update the order, the removed nodes are
+        # filtered out once here.
+        if self.__rpo_removed:
+            self.__rpo = [node for node in self.__rpo if node in self.nodes]
+            self.__rpo_removed = False
+        return self.__rpo
+
+    def __invalidate(self):
+        self.__all_sucs = {}
+        self.__all_preds = {}
+        self.__block_order = None
 
     def sucs(self, node):
         return self.edges.get(node, [])[:]
 
     def all_sucs(self, node):
-        return self.edges.get(node, []) + self.catch_edges.get(node, [])
+        sucs = self.__all_sucs.get(node)
+        if sucs is None:
+            sucs = self.__all_sucs[node] = self.edges.get(node, []) + self.catch_edges.get(node, [])
+        return sucs
 
     def all_catches(self, node):
         return self.catch_edges.get(node, [])[:]
@@ -35,16 +61,21 @@ class Graph(object):
         return [n for n in self.reverse_edges.get(node, []) if not n.in_catch]
 
     def all_preds(self, node):
-        return (self.reverse_edges.get(node, []) + self.reverse_catch_edges.get(
-            node, []))
+        preds = self.__all_preds.get(node)
+        if preds is None:
+            preds = self.__all_preds[node] = (self.reverse_edges.get(node, []) + self.reverse_catch_edges.get(
+                node, []))
+        return preds
 
     def add_node(self, node):
-        self.nodes.append(node)
+        self.nodes[node] = None
+        self.__block_order = None
 
     def add_landing_pad(self, pad):
         self.landing_pads.append(pad)
 
     def add_edge(self, e1, e2):
+        self.__invalidate()
         lsucs = self.edges[e1]
         if e2 not in lsucs:
             lsucs.append(e2)
@@ -53,6 +84,7 @@ class Graph(object):
             lpreds.append(e1)
 
     def remove_edge(self, e1, e2):
+        self.__invalidate()
         lsucs = self.edges[e1]
         if e2 in lsucs:
             lsucs.remove(e2)
@@ -62,6 +94,7 @@ class Graph(object):
             lpreds.remove(e1)
 
     def add_catch_edge(self, e1, e2):
+        self.__invalidate()
         lsucs = self.catch_edges[e1]
         if e2 not in lsucs:
             lsucs.append(e2)
@@ -70,6 +103,7 @@ class Graph(object):
             lpreds.append(e1)
 
     def remove_node(self, node):
+        self.__invalidate()
         preds = self.reverse_edges.get(node, [])
         for pred in preds:
             self.edges[pred].remove(node)
@@ -86,9 +120,8 @@ class Graph(object):
         for suc in exc_succs:
             self.reverse_catch_edges[suc].remove(node)
 
-        self.nodes.remove(node)
-        if node in self.rpo:
-            self.rpo.remove(node)
+        del self.nodes[node]
+        self.__rpo_removed = True
         del node
 
     def number_ins(self):
@@ -124,13 +157,22 @@ class Graph(object):
         nb = len(self.nodes) + 1
         for node in self.post_order():
             node.num = nb - node.po
-        self.rpo = sorted(self.nodes, key=lambda n: n.num)
+        self.__rpo = sorted(self.nodes, key=lambda n: n.num)
+        self.__rpo_removed = False
+        # the nodes are no longer numbered in block order
+        self.__block_order = None
 
     def compute_block_order(self):
-        list = sorted(self.nodes, key=lambda n: n.start)
-        for num, node in enumerate(list):
-            node.num = num
-        return list
+        """
+        Number the nodes by start offset and return them in this order.
+        The returned list is shared by the callers and must not be modified.
+        """
+        if self.__block_order is None:
+            list = sorted(self.nodes, key=lambda n: n.start)
+            for num, node in enumerate(list):
+                node.num = num
+            self.__block_order = list
+        return self.__block_order
 
     def post_order(self):
         """
@@ -138,18 +180,23 @@ class Graph(object):
         children of a node before visiting the node itself.
         """
 
-        def _visit(n, cnt):
-            visited.add(n)
-            for suc in self.all_sucs(n):
+        # Depth first search with an explicit stack of (node, successors
+        # iterator), so that deep graphs do not hit the recursion limit.
+        cnt = 1
+        visited = {self.entry}
+        stack = [(self.entry, iter(self.all_sucs(self.entry)))]
+        while stack:
+            node, sucs = stack[-1]
+            for suc in sucs:
                 if suc not in visited:
-                    for cnt, s in _visit(suc, cnt):
-                        yield cnt, s
-            n.po = cnt
-            yield cnt + 1, n
-
-        visited = set()
-        for _, node in _visit(self.entry, 1):
-            yield node
+                    visited.add(suc)
+                    stack.append((suc, iter(self.all_sucs(suc))))
+                    break
+            else:
+                stack.pop()
+                node.po = cnt
+                cnt += 1
+                yield node
 
     def immediate_dominators(self):
         return dom_lt(self)
@@ -158,7 +205,7 @@ class Graph(object):
         return len(self.nodes)
 
     def __repr__(self):
-        return str(self.nodes)
+        return str(list(self.nodes))
 
     def __iter__(self):
         for node in self.nodes:
@@ -166,23 +213,23 @@ class Graph(object):
 
 
 def dom_lt(graph):
-    """Dominator algorithm from Lengaeur-Tarjan"""
-
-    def _dfs(v, n):
-        semi[v] = n = n + 1
-        vertex[n] = label[v] = v
-        ancestor[v] = 0
-        for w in graph.all_sucs(v):
-            if not semi[w]:
-                parent[w] = v
-                n = _dfs(w, n)
-            pred[w].add(v)
-        return n
+    """
+    Dominator algorithm from Lengaeur-Tarjan
+
+    The nodes are numbered in DFS order and the algorithm works on arrays
+    indexed by these numbers, number 0 standing for no node. The DFS and
+    the path compression are done with explicit stacks.
+    """
 
     def _compress(v):
-        u = ancestor[v]
-        if ancestor[u]:
-            _compress(u)
+        # Collect the path up to the last ancestor of the forest, then
+        # compress it starting from the top.
+        path = []
+        while ancestor[ancestor[v]]:
+            path.append(v)
+            v = ancestor[v]
+        for v in reversed(path):
+            u = ancestor[v]
             if semi[label[u]] < semi[label[v]]:
                 label[v] = label[u]
             ancestor[v] = ancestor[u]
@@ -193,37 +240,61 @@ def dom_lt(graph):
             return label[v]
         return v
 
-    def _link(v, w):
-        ancestor[w] = v
-
-    parent, ancestor, vertex = {}, {}, {}
-    label, dom = {}, {}
-    pred, bucket = defaultdict(set), defaultdict(set)
-
-    # Step 1:
-    semi = {v: 0 for v in graph.nodes}
-    n = _dfs(graph.entry, 0)
-    for i in range(n, 1, -1):
-        w = vertex[i]
+    # Step 1: number the nodes in DFS order, node_id maps a node to its
+    # number and vertex the number to the node.
+    node_id = {graph.entry: 1}
+    vertex = [None, graph.entry]
+    parent = [0, 0]
+    sucs = [None, graph.all_sucs(graph.entry)]
+    pred = [None, []]
+    stack = [(1, 0)]
+    while stack:
+        v, i = stack.pop()
+        v_sucs = sucs[v]
+        while i < len(v_sucs):
+            w = v_sucs[i]
+            i += 1
+            w_id = node_id.get(w)
+            if w_id is None:
+                w_id = node_id[w] = len(vertex)
+                vertex.append(w)
+                parent.append(v)
+                sucs.append(graph.all_sucs(w))
+                pred.append([v])
+                stack.append((v, i))
+                stack.append((w_id, 0))
+                break
+            pred[w_id].append(v)
+    n = len(vertex) - 1
+
+    semi = list(range(n + 1))
+    label = list(range(n + 1))
+    ancestor = [0] * (n + 1)
+    idom = [0] * (n + 1)
+    bucket = [[] for _ in range(n + 1)]
+
+    for w in range(n, 1, -1):
         # Step 2:
         for v in pred[w]:
             u = _eval(v)
-            y = semi[w] = min(semi[w], semi[u])
-        bucket[vertex[y]].add(w)
+            if semi[u] < semi[w]:
+                semi[w] = semi[u]
+        bucket[semi[w]].append(w)
         pw = parent[w]
-        _link(pw, w)
+        # link
+        ancestor[w] = pw
         # Step 3:
         bpw = bucket[pw]
-        while bpw:
-            v = bpw.pop()
+        for v in bpw:
             u = _eval(v)
-            dom[v] = u if semi[u] < semi[v] else pw
+            idom[v] = u if semi[u] < semi[v] else pw
+        del bpw[:]
     # Step 4:
-    for i in range(2, n + 1):
-        w = vertex[i]
-        dw = dom[w]
-        if dw != vertex[semi[w]]:
-            dom[w] = dom[dw]
+    for w in range(2, n + 1):
+        if idom[w] != semi[w]:
+            idom[w] = idom[idom[w]]
+
+    dom = {vertex[w]: vertex[idom[w]] for w in range(2, n + 1)}
     dom[graph.entry] = None
     return dom
 
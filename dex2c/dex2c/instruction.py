@@ -7,12 +7,15 @@ logger = logging.getLogger('dex2c.instruction')
 
 
 class Value(object):
+    __slots__ = ('var_type', 'type_sealed', 'definition', 'uses', 'is_const')
+
     def __init__(self):
         self.var_type = None
         self.type_sealed = False
 
         self.definition = None
-        self.uses = set()
+        # user -> Use, in the order the users were added
+        self.uses = {}
         self.is_const = False
 
     def set_type(self, vtype: str):
@@ -93,40 +96,32 @@ class Value(object):
         return len(self.uses) == 0
 
     def get_uses(self):
-        return self.uses
+        return list(self.uses.values())
 
     def get_users(self):
-        users = set()
-        for use in self.uses:
-            users.add(use.get_user())
-        return list(users)
+        return list(self.uses)
 
     def add_user(self, instr):
-        for use in self.uses:
-            if use.get_user() == instr:
-                return
-        else:
-            use = Use(self, instr)
-            self.uses.add(use)
+        if instr not in self.uses:
+            self.uses[instr] = Use(self, instr)
 
     def visit_decl(self, visitor):
         return visitor.visit_decl(self)
 
     def remove_user(self, user):
-        new_uses = set()
-        for use in self.uses:
-            if user != use.get_user():
-                new_uses.add(use)
-        self.uses = new_uses
+        self.uses.pop(user, None)
 
     def replace_all_uses_with(self, new_value):
-        for use in self.uses:
+        # the users remove themselves from self.uses
+        for use in list(self.uses.values()):
             user = use.get_user()
             user.replase_use_of_with(use.get_value(), new_value)
         self.uses.clear()
 
 
 class Use(object):
+    __slots__ = ('value', 'user')
+
     def __init__(self, value: Value, user):
         self.value = value
         self.user = user
@@ -139,6 +134,8 @@ class Use(object):
 
 
 class Constant(Value):
+    __slots__ = ('constant',)
+
     def __init__(self, value, vtype=None):
         super(Constant, self).__init__()
         self.constant = value
@@ -171,6 +168,9 @@ class Constant(Value):
 
 
 class Variable(Value):
+    # declared is set by the writer on the exception variables
+    __slots__ = ('register', 'version', 'declared')
+
     def __init__(self, register, version):
         super(Variable, self).__init__()
         self.register = register
@@ -196,6 +196,8 @@ class Variable(Value):
 
 
 class Phi(Variable):
+    __slots__ = ('operands', 'block', 'phi_users')
+
     def __init__(self, register, version):
         super(Phi, self).__init__(register, version)
         self.operands = {}
@@ -1041,7 +1043,7 @@ class ThrowExpression(Instruction):
         self.operands.append(ref)
 
     def resolve_type(self):
-        return self.operands[0].set_type('Ljava/lang/Throwable;')
+        return self.operands[0].refine_type('Ljava/lang/Throwable;')
 
     def visit(self, visitor):
         return visitor.visit_throw(self, self.operands[0])
@@ -84,6 +84,27 @@ ACCESS_ORDER = [0x1, 0x4, 0x2, 0x400, 0x8, 0x10, 0x80, 0x40, 0x20, 0x100, 0x800,
 
 TYPE_LEN = {'J': 2, 'D': 2, }
 
+# Kind bits of a type descriptor, see get_type_kind
+TYPE_KIND_INT = 0x1  # Z, B, C, S, I and J
+TYPE_KIND_LONG = 0x2
+TYPE_KIND_FLOAT = 0x4  # F and D
+TYPE_KIND_PRIMITIVE = 0x8
+TYPE_KIND_REF = 0x10
+TYPE_KIND_ARRAY = 0x20
+TYPE_KIND_OBJECT = 0x40  # Ljava/lang/Object;
+TYPE_KIND_OBJECT_ARRAY = 0x80  # array of java.lang.Object, of any dimension
+
+# type descriptor -> kind bits
+_type_kinds = {None: 0}
+# (type1, type2) -> merge_type(type1, type2)
+_merged_types = {}
+# ClassHierarchy used to merge the class types, see set_class_hierarchy
+_class_hierarchy = None
+
+# Packages of the classes of the boot classpath
+BOOT_CLASSPATH_PACKAGES = ('Ljava/', 'Ljavax/', 'Ldalvik/', 'Landroid/', 'Lcom/android/', 'Llibcore/', 'Lsun/',
+                           'Lorg/apache/', 'Lorg/json/', 'Lorg/w3c/', 'Lorg/xml/', 'Lorg/xmlpull/', 'Lorg/ccil/')
+
 
 def get_access_class(access):
     sorted_access = [i for i in ACCESS_ORDER if i & access]
@@ -208,7 +229,7 @@ def get_type_descriptor(atype):
 
 
 def is_primitive_type(atype):
-    return atype and atype in PRIMITIVE_TYPE_ORDER
+    return bool(get_type_kind(atype) & TYPE_KIND_PRIMITIVE)
 
 
 def get_params_type(descriptor):
@@ -223,7 +244,7 @@ def get_params_type(descriptor):
 
 def get_method_triple(method, return_type=True):
     method_triple = method.get_triple()
-    cls_name = method.class_name
+    cls_name = method.get_class_name()
     _, name, proto = method_triple
     if return_type:
         return cls_name, name, proto
@@ -248,8 +269,42 @@ def get_native_type(jtype):
     return res
 
 
+def _compute_type_kind(atype):
+    if not atype:
+        return 0
+    kind = 0
+    if atype in 'ZBCSIJ':
+        kind |= TYPE_KIND_INT
+    if atype == 'J':
+        kind |= TYPE_KIND_LONG
+    if atype in 'FD':
+        kind |= TYPE_KIND_FLOAT
+    if atype in PRIMITIVE_TYPE_ORDER:
+        kind |= TYPE_KIND_PRIMITIVE
+    if atype[0] == 'L' or atype[0] == '[':
+        kind |= TYPE_KIND_REF
+    if atype[0] == '[':
+        kind |= TYPE_KIND_ARRAY
+        if atype.endswith('Ljava/lang/Object;'):
+            kind |= TYPE_KIND_OBJECT_ARRAY
+    if atype == 'Ljava/lang/Object;':
+        kind |= TYPE_KIND_OBJECT
+    return kind
+
+
+def get_type_kind(atype):
+    """
+    Return the TYPE_KIND_* bits of a type descriptor, computed once for
+    each descriptor.
+    """
+    kind = _type_kinds.get(atype)
+    if kind is None:
+        kind = _type_kinds[atype] = _compute_type_kind(atype)
+    return kind
+
+
 def is_int(atype):
-    return atype and atype in 'ZBCSIJ'
+    return bool(get_type_kind(atype) & TYPE_KIND_INT)
 
 
 def is_long(atype):
@@ -257,23 +312,23 @@ def is_long(atype):
 
 
 def is_float(atype):
-    return atype and atype in 'FD'
+    return bool(get_type_kind(atype) & TYPE_KIND_FLOAT)
 
 
 def is_ref(atype):
-    return atype and (atype[0] == 'L' or atype[0] == '[')
+    return bool(get_type_kind(atype) & TYPE_KIND_REF)
 
 
 def is_array(atype):
-    return atype and atype[0] == '['
+    return bool(get_type_kind(atype) & TYPE_KIND_ARRAY)
 
 
 def is_java_lang_object(atype):
-    return atype and atype == 'Ljava/lang/Object;'
+    return atype == 'Ljava/lang/Object;'
 
 
 def is_java_lang_object_array(atype):
-    return is_array(atype) and atype.endswith('Ljava/lang/Object;')
+    return bool(get_type_kind(atype) & TYPE_KIND_OBJECT_ARRAY)
 
 
 # Use for variable declaration
@@ -375,6 +430,18 @@ def merge_array_type(type1, type2):
         return merge_array_type(type2, type1)
 
 
+def set_class_hierarchy(hierarchy):
+    """
+    Set the :class:`ClassHierarchy` used by merge_type to find the common
+    superclass of two class types. Without one, two different class types
+    are merged to java.lang.Object.
+    """
+    global _class_hierarchy
+    if hierarchy is not _class_hierarchy:
+        _class_hierarchy = hierarchy
+        _merged_types.clear()
+
+
 # return bigger type
 def merge_reference_type(type1, type2):
     if type1 == type2:
@@ -383,11 +450,54 @@ def merge_reference_type(type1, type2):
         return type1
     elif is_java_lang_object(type2) and is_ref(type1):
         return type2
+    elif _class_hierarchy is not None and type1[0] == 'L' and type2[0] == 'L':
+        return _class_hierarchy.get_common_superclass(type1, type2)
     else:
         return 'Ljava/lang/Object;'
 
 
+def is_boot_class(atype):
+    """
+    Return True if the class is in a package of the boot classpath, whose
+    classes are loaded before the ones of the app with the same name
+    """
+    return atype.startswith(BOOT_CLASSPATH_PACKAGES)
+
+
+def is_assignable(type1, type2):
+    """
+    Return True if a value of the reference type type1 is known to be
+    assignable to type2, with the ClassHierarchy of set_class_hierarchy.
+
+    The hierarchy declared by the dex files is only trusted for the classes
+    of the app: a class of the boot classpath with the same name would be
+    loaded instead, with its own superclasses.
+    """
+    if type1 == type2 or (is_java_lang_object(type2) and is_ref(type1)):
+        return True
+    if _class_hierarchy is None or type1[0] != 'L' or type2[0] != 'L' \
+            or not _class_hierarchy.is_subtype(type1, type2):
+        return False
+    # the classes between type1 and type2 in the hierarchy
+    path = [name for name in _class_hierarchy.get_supertypes(type1) if _class_hierarchy.is_subtype(name, type2)]
+    return not any(is_boot_class(name) for name in path)
+
+
 def merge_type(type1, type2):
+    """
+    Return the type of a value which can be of type1 or type2, None if
+    they can not be merged. The results are cached.
+    """
+    key = (type1, type2)
+    try:
+        return _merged_types[key]
+    except KeyError:
+        pass
+    new_type = _merged_types[key] = _merge_type(type1, type2)
+    return new_type
+
+
+def _merge_type(type1, type2):
     if type1 is None and type2 is None:
         return None
     if type1 is None:
@@ -395,16 +505,17 @@ def merge_type(type1, type2):
     if type2 is None:
         return type1
 
-    if (is_int(type1) and is_int(type2)) or \
-            (is_float(type1) and is_float(type2)):
+    kind1 = get_type_kind(type1)
+    kind2 = get_type_kind(type2)
+    if (kind1 & kind2 & (TYPE_KIND_INT | TYPE_KIND_FLOAT)):
         return get_bigger_type(type1, type2)
-    elif is_array(type1) or is_array(type2):
+    elif (kind1 | kind2) & TYPE_KIND_ARRAY:
         new_type = merge_array_type(type1, type2)
         if new_type is None:
             return 'Ljava/lang/Object;'
         else:
             return new_type
-    elif is_ref(type1) or is_ref(type2):
+    elif (kind1 | kind2) & TYPE_KIND_REF:
         return merge_reference_type(type1, type2)
     else:
         return None
@@ -2,10 +2,12 @@ import logging
 from builtins import object
 from builtins import range
 from builtins import zip
+from collections import OrderedDict
 from struct import unpack
 
 from dex2c import util
-from dex2c.instruction import BinaryCompExpression, Constant
+from dex2c.instruction import BinaryCompExpression, CheckCastExpression, Constant, InstanceExpression, \
+    InvokeInstruction, MoveExpression, MoveParam, NewInstance, StaticExpression
 from dex2c.opcode_ins import Op
 from dex2c.util import get_type_descriptor, get_native_type, JniLongName, is_primitive_type, \
     get_cdecl_type, get_type
@@ -34,14 +36,107 @@ class TmpnameAllocator(object):
         return '%s%s' % (self.prefix, self.numbering[item])
 
 
+def get_catch_handles(landing_pad):
+    """
+    Yield the (type, handle) of the catch handles of `landing_pad` checked
+    against the exception. A handle of Throwable catches everything, the
+    handles after it are never reached.
+    """
+    for atype, handle in landing_pad.handles.items():
+        if atype == 'Ljava/lang/Throwable;':
+            return
+        yield atype, handle
+
+
+# The methods of dvm.INLINE_METHODS lowered to C expressions instead of a JNI
+# call, {0} is the first argument, the receiver of the String methods. The
+# flag tells whether the expression can throw, the String methods throw a
+# NullPointerException on a null receiver and charAt an
+# StringIndexOutOfBoundsException.
+INTRINSICS = {
+    ('Ljava/lang/String;', 'charAt', '(I)C'): ('d2c_string_char_at(env, (jstring) {0}, {1})', True),
+    ('Ljava/lang/String;', 'isEmpty', '()Z'): ('env->GetStringLength((jstring) {0}) == 0', True),
+    ('Ljava/lang/String;', 'length', '()I'): ('env->GetStringLength((jstring) {0})', True),
+    ('Ljava/lang/Math;', 'abs', '(I)I'): ('d2c_abs_int({0})', False),
+    ('Ljava/lang/Math;', 'abs', '(J)J'): ('d2c_abs_long({0})', False),
+    ('Ljava/lang/Math;', 'abs', '(F)F'): ('fabsf({0})', False),
+    ('Ljava/lang/Math;', 'abs', '(D)D'): ('fabs({0})', False),
+    ('Ljava/lang/Math;', 'min', '(II)I'): ('({0} < {1} ? {0} : {1})', False),
+    ('Ljava/lang/Math;', 'max', '(II)I'): ('({0} > {1} ? {0} : {1})', False),
+    ('Ljava/lang/Math;', 'sqrt', '(D)D'): ('sqrt({0})', False),
+    ('Ljava/lang/Math;', 'cos', '(D)D'): ('cos({0})', False),
+    ('Ljava/lang/Math;', 'sin', '(D)D'): ('sin({0})', False),
+    ('Ljava/lang/Float;', 'floatToIntBits', '(F)I'): ('d2c_float_to_int_bits({0})', False),
+    ('Ljava/lang/Float;', 'floatToRawIntBits', '(F)I'): ('d2c_float_to_raw_int_bits({0})', False),
+    ('Ljava/lang/Float;', 'intBitsToFloat', '(I)F'): ('d2c_bitcast_to_float({0})', False),
+    ('Ljava/lang/Double;', 'doubleToLongBits', '(D)J'): ('d2c_double_to_long_bits({0})', False),
+    ('Ljava/lang/Double;', 'doubleToRawLongBits', '(D)J'): ('d2c_double_to_raw_long_bits({0})', False),
+    ('Ljava/lang/Double;', 'longBitsToDouble', '(J)D'): ('d2c_bitcast_to_double({0})', False),
+}
+
+
+def get_intrinsic(ins):
+    """
+    Return the (expression, can throw) of INTRINSICS lowering the invoke
+    `ins`, or None
+    """
+    if not isinstance(ins, InvokeInstruction) or ins.invoke_type == 'super':
+        return None
+    return INTRINSICS.get((ins.clsdesc, ins.name, '(%s)%s' % (''.join(ins.ptype), ins.rtype)))
+
+
+def get_defined_type(value):
+    """
+    Return the type the definition of `value` guarantees, through the moves:
+    the type of a parameter, the return type of an invoke, the type of a
+    field or the class of a new-instance. None for the other definitions.
+    """
+    definition = value.definition
+    while isinstance(definition, MoveExpression):
+        value = definition.operands[0]
+        definition = value.definition
+    if isinstance(definition, MoveParam):
+        # sealed to the type of the parameter when it is created
+        return value.get_type()
+    if isinstance(definition, InvokeInstruction):
+        return definition.rtype
+    if isinstance(definition, (InstanceExpression, StaticExpression)):
+        return definition.ftype
+    if isinstance(definition, NewInstance):
+        return definition.type
+    return None
+
+
+def is_redundant_cast(ins):
+    """
+    Return True if `ins` is a check-cast which always succeeds: the verifier
+    guarantees the type of the definition of the value, see
+    get_defined_type, and it is assignable to the type of the cast.
+    """
+    if not isinstance(ins, CheckCastExpression):
+        return False
+    defined_type = get_defined_type(ins.operands[0])
+    return defined_type is not None and util.is_ref(defined_type) and util.is_assignable(defined_type, ins.clsdesc)
+
+
 class Writer(object):
-    def __init__(self, irmethod, dynamic_register):
+    def __init__(self, irmethod, dynamic_register, static_ids=False, resolve_table=False, string_pool=False):
         self.graph = irmethod.graph
         self.method = irmethod.method
         self.irmethod = irmethod
         self.visited_nodes = set()
         self.buffer = []
         self.dynamic_register = dynamic_register
+        # The class, field and method IDs are cached in static storage shared
+        # by all the calls of the method, instead of locals of each call.
+        self.static_ids = static_ids
+        # The IDs are resolved through the global table of ResolveTable,
+        # D2C_ID_<n> is the n-th reference of table_refs.
+        self.resolve_table = resolve_table
+        # The string constants are interned in the global pool of
+        # ResolveTable, shared by all the methods.
+        self.string_pool = string_pool
+        self.table_refs = {}
         self.prototype = []
 
         entry = irmethod.entry
@@ -49,6 +144,11 @@ class Writer(object):
         self.ca = TmpnameAllocator(entry.class_to_declare, 'cls').get_name
         self.fa = TmpnameAllocator(entry.field_to_declare, 'fld').get_name
         self.ma = TmpnameAllocator(entry.method_to_declare, 'mth').get_name
+        # The classes of the catch handlers, resolved once and shared by the
+        # landing pads of the method.
+        self.catch_types = list(OrderedDict.fromkeys(
+            atype for landing_pad in irmethod.landing_pads for atype, _ in get_catch_handles(landing_pad)))
+        self.ea = TmpnameAllocator(self.catch_types, 'exc').get_name
 
     def __str__(self):
         return ''.join(self.buffer)
@@ -56,6 +156,34 @@ class Writer(object):
     def get_prototype(self):
         return ''.join(self.prototype)
 
+    def get_table_refs(self):
+        return sorted(self.table_refs, key=self.table_refs.get)
+
+    def get_table_id(self, ref):
+        if ref not in self.table_refs:
+            self.table_refs[ref] = len(self.table_refs)
+        return 'D2C_ID_%d' % self.table_refs[ref]
+
+    def get_resolve_macro(self, kind):
+        if self.static_ids:
+            return 'D2C_RESOLVE_SHARED_%s' % kind
+        return 'D2C_RESOLVE_%s' % kind
+
+    def write_resolve_class(self, class_name):
+        if self.resolve_table:
+            self.write('D2C_RESOLVE_TABLE_CLASS(clz, %s);\n' % self.get_table_id(('CLASS', class_name)))
+        else:
+            self.write('%s(clz,"%s");\n' % (self.get_resolve_macro('CLASS'), class_name))
+
+    def write_resolve_member(self, kind, cached, class_name, name, signature):
+        if self.resolve_table:
+            class_id = self.get_table_id(('CLASS', class_name))
+            member_id = self.get_table_id((kind, class_name, name, signature))
+            self.write('D2C_RESOLVE_TABLE_MEMBER(clz, %s, %s, %s);\n' % (cached, class_id, member_id))
+        else:
+            self.write('%s(clz, %s, "%s", "%s", "%s");\n' % (
+                self.get_resolve_macro(kind), cached, class_name, name, signature))
+
     def write_trace(self, ins):
         s = ins.dump()
         if s:
@@ -111,6 +239,8 @@ class Writer(object):
             if self.dynamic_register:
                 self.prototype.append('(JNIEnv *env, jobject thiz)')
         self.write('{\n')
+        if self.catch_types:
+            self.write('static jclass %s;\n' % ', '.join('%s = NULL' % self.ea(atype) for atype in self.catch_types))
         nodes = self.irmethod.irblocks
         for node in nodes:
             self.visit_node(node)
@@ -149,6 +279,7 @@ class Writer(object):
         if node.var_to_declare and self.irmethod.landing_pads:
             self.write("jthrowable exception;\n")
 
+        storage = 'static ' if self.static_ids and not self.resolve_table else ''
         declared = set()
         to_declare = []
         for jclass in node.class_to_declare:
@@ -157,7 +288,7 @@ class Writer(object):
             declared.add(jclass)
             to_declare.append('%s = NULL' % (self.ca(jclass)))
         if to_declare:
-            self.write('jclass %s;\n' % (','.join(to_declare)))
+            self.write('%sjclass %s;\n' % (storage, ','.join(to_declare)))
 
         declared.clear()
         to_declare.clear()
@@ -167,7 +298,7 @@ class Writer(object):
             declared.add(jfield)
             to_declare.append('%s = NULL' % (self.fa(jfield)))
         if to_declare:
-            self.write('jfieldID %s;\n' % (','.join(to_declare)))
+            self.write('%sjfieldID %s;\n' % (storage, ','.join(to_declare)))
 
         declared.clear()
         to_declare.clear()
@@ -177,7 +308,7 @@ class Writer(object):
             declared.add(jmethod)
             to_declare.append('%s = NULL' % (self.ma(jmethod)))
         if to_declare:
-            self.write('jmethodID %s;\n' % (', '.join(to_declare)))
+            self.write('%sjmethodID %s;\n' % (storage, ', '.join(to_declare)))
 
         for ins in node.move_param_insns:
             ins.visit(self)
@@ -186,11 +317,16 @@ class Writer(object):
     def visit_landing_pad(self, landing_pad):
         self.write("%s:\n" % (landing_pad.label))
         self.write("D2C_GET_PENDING_EX\n")
-        for atype, handle in landing_pad.handles.items():
-            self.write('if(d2c_is_instance_of(env, exception, "%s")) {\n' % (get_type(atype)))
+        for atype, handle in get_catch_handles(landing_pad):
+            self.write('if(d2c_is_instance_of_shared(env, exception, &%s, "%s")) {\n' % (
+                self.ea(atype), get_type(atype)))
             self.write('goto L%d;\n' % handle.num)
             self.write('}\n')
-        self.write("D2C_GOTO_UNWINDBLOCK\n")
+        catch_all = landing_pad.handles.get('Ljava/lang/Throwable;')
+        if catch_all is not None:
+            self.write('goto L%d;\n' % catch_all.num)
+        else:
+            self.write("D2C_GOTO_UNWINDBLOCK\n")
 
     def write_delete_dead_local_reference(self, val):
         if val.use_empty() and val.get_register() < 0:
@@ -238,6 +374,9 @@ class Writer(object):
             self.write('v%s = d2c_bitcast_to_float(%r);\n' % (self.ra(val), cst))
         elif atype == 'D':
             self.write('v%s = d2c_bitcast_to_double(%r);\n' % (self.ra(val), cst))
+        elif cst_type == 'Ljava/lang/String;' and self.string_pool:
+            self.write('v%s = (%s) d2c_get_pool_string(env, %s);\n' % (
+                self.ra(val), get_native_type(atype), self.get_table_id(('STRING', cst))))
         elif cst_type == 'Ljava/lang/String;':
             c = 'v%s = (%s) env->NewStringUTF(AY_OBFUSCATE("%s"));\n' if obfus else 'v%s = (%s) env->NewStringUTF("%s");\n'
             self.write(
@@ -246,7 +385,7 @@ class Writer(object):
             self.write('{\n')
             self.write_define_ex_handle(ins)
             self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-            self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (cst))
+            self.write_resolve_class(cst)
             self.write('v%s = env->NewLocalRef(clz);\n' % (self.ra(val)))
             self.write_undefine_ex_handle(ins)
             self.write('}\n')
@@ -310,7 +449,7 @@ class Writer(object):
         self.write_define_ex_handle(ins)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
         self.write('jfieldID &fld = %s;\n' % (self.fa(ins.get_field())))
-        self.write('D2C_RESOLVE_STATIC_FIELD(clz, fld, "%s", "%s", "%s");\n' % (get_type(clsdesc), name, ftype))
+        self.write_resolve_member('STATIC_FIELD', 'fld', get_type(clsdesc), name, ftype)
         self.write('env->SetStatic%sField(clz,fld,(%s) %s);\n' % (
             get_type_descriptor(ftype), get_native_type(ftype), self.get_variable_or_const(rhs)))
         self.write_undefine_ex_handle(ins)
@@ -326,7 +465,7 @@ class Writer(object):
         self.write_not_null(lhs)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
         self.write('jfieldID &fld = %s;\n' % (self.fa(ins.get_field())))
-        self.write('D2C_RESOLVE_FIELD(clz, fld, "%s", "%s", "%s");\n' % (get_type(clsdesc), name, ftype))
+        self.write_resolve_member('FIELD', 'fld', get_type(clsdesc), name, ftype)
         self.write('env->Set%sField(v%s,fld,(%s) %s);\n' % (
             get_type_descriptor(ftype), self.ra(lhs), get_native_type(ftype), self.get_variable_or_const(rhs)))
         self.write_undefine_ex_handle(ins)
@@ -340,7 +479,7 @@ class Writer(object):
         # so this ref may be double killed in exception handle.
         self.write_kill_local_reference(ins.get_value())
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-        self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (get_type(atype)))
+        self.write_resolve_class(get_type(atype))
         self.write('v%s = (%s) env->AllocObject(clz);\n' % (self.ra(result), get_native_type(result.get_type())))
         self.write_undefine_ex_handle(ins)
         self.write('}\n')
@@ -352,10 +491,11 @@ class Writer(object):
             self.write("D2C_NOT_NULL(v%s);\n" % (self.ra(base)))
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
         self.write('jmethodID &mid = %s;\n' % (self.ma(ins.get_call_method())))
+        signature = '(%s)%s' % (''.join(ptype), rtype)
         if invoke_type != 'static':
-            self.write('D2C_RESOLVE_METHOD(clz, mid, "%s", "%s", "(%s)%s");\n' % (get_type(clsdesc), name, ''.join(ptype), rtype))
+            self.write_resolve_member('METHOD', 'mid', get_type(clsdesc), name, signature)
         else:
-            self.write('D2C_RESOLVE_STATIC_METHOD(clz, mid, "%s", "%s", "(%s)%s");\n' % (get_type(clsdesc), name, ''.join(ptype), rtype))
+            self.write_resolve_member('STATIC_METHOD', 'mid', get_type(clsdesc), name, signature)
         self.write('jvalue args[] = {')
         vars = []
         for arg, atype in zip(args, ptype):
@@ -400,8 +540,26 @@ class Writer(object):
         if rtype != 'V':
             self.write_delete_dead_local_reference(ins.get_value())
 
+    def write_intrinsic(self, ins, intrinsic, base, args):
+        expression, can_throw = intrinsic
+        operands = [] if base is None else [base]
+        operands.extend(args)
+        if can_throw:
+            self.write('{\n')
+            self.write_define_ex_handle(ins)
+            self.write_not_null(base)
+        ins.get_value().visit(self)
+        self.write(' = (%s) (%s);\n' % (get_native_type(ins.get_value().get_type()), expression.format(
+            *[self.get_variable_or_const(operand) for operand in operands])))
+        if can_throw:
+            self.write_undefine_ex_handle(ins)
+            self.write('}\n')
+
     def visit_invoke(self, ins, invoke_type, name, base, ptype, rtype, args, clsdesc):
         self.write_trace(ins)
+        intrinsic = get_intrinsic(ins)
+        if intrinsic is not None:
+            return self.write_intrinsic(ins, intrinsic, base, args)
         return self._invoke_common(ins, invoke_type, name, base, ptype, rtype, args, clsdesc)
 
     def visit_return_void(self):
@@ -424,10 +582,12 @@ class Writer(object):
 
     def visit_check_cast(self, ins, arg, atype):
         self.write_trace(ins)
+        if is_redundant_cast(ins):
+            return
         self.write('{\n')
         self.write_define_ex_handle(ins)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-        self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (get_type(atype)))
+        self.write_resolve_class(get_type(atype))
         self.write('D2C_CHECK_CAST(%s, clz, "%s");\n' % (self.get_variable_or_const(arg), get_type(atype)))
         self.write_undefine_ex_handle(ins)
         self.write('}\n')
@@ -437,7 +597,7 @@ class Writer(object):
         self.write('{\n')
         self.write_define_ex_handle(ins)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-        self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (get_type(atype)))
+        self.write_resolve_class(get_type(atype))
         self.write('v%s = d2c_is_instance_of(env, v%s, clz);\n' % (self.ra(result), self.ra(arg)))
         self.write_undefine_ex_handle(ins)
         self.write('}\n')
@@ -494,7 +654,7 @@ class Writer(object):
                 get_native_type(result.get_type()), get_type_descriptor(elem_type), self.get_variable_or_const(size)))
         else:
             self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-            self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (get_type(elem_type)))
+            self.write_resolve_class(get_type(elem_type))
             result.visit(self)
             self.write(' = env->NewObjectArray((jint) %s, clz, NULL);\n' % (self.get_variable_or_const(size)))
         self.write_undefine_ex_handle(ins)
@@ -516,7 +676,7 @@ class Writer(object):
             self.write(' = env->New%sArray((jint) %r);\n' % (get_type_descriptor(elem_type), size))
         else:
             self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
-            self.write('D2C_RESOLVE_CLASS(clz,"%s");\n' % (get_type(elem_type)))
+            self.write_resolve_class(get_type(elem_type))
             result.visit(self)
             self.write(' = env->NewObjectArray((jint) %r, clz, NULL);\n' % (size))
         self.write('d2c_filled_new_array(env, (jarray) v%s, "%s", %d, %s);\n'
@@ -751,7 +911,7 @@ class Writer(object):
         self.write_kill_local_reference(result)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
         self.write('jfieldID &fld = %s;\n' % (self.fa(ins.get_field())))
-        self.write('D2C_RESOLVE_FIELD(clz, fld, "%s", "%s", "%s");\n' % (get_type(clsdesc), name, ftype))
+        self.write_resolve_member('FIELD', 'fld', get_type(clsdesc), name, ftype)
         result.visit(self)
         self.write(
             ' = (%s) env->Get%sField(v%s,fld);\n' % (
@@ -778,7 +938,7 @@ class Writer(object):
         self.write_kill_local_reference(result)
         self.write('jclass &clz = %s;\n' % (self.ca(ins.get_class())))
         self.write('jfieldID &fld = %s;\n' % (self.fa(ins.get_field())))
-        self.write('D2C_RESOLVE_STATIC_FIELD(clz, fld, "%s", "%s", "%s");\n' % (get_type(clsdesc), name, ftype))
+        self.write_resolve_member('STATIC_FIELD', 'fld', get_type(clsdesc), name, ftype)
         result.visit(self)
         self.write(' = (%s) env->GetStatic%sField(clz,fld);\n' % (
             get_native_type(result.get_type()), get_type_descriptor(ftype)))
@@ -790,3 +950,63 @@ class Writer(object):
             return '%s' % var
         else:
             return 'v%s' % self.ra(var)
+
+
+class ResolveTable(object):
+    """
+    Global table of the classes, methods and fields referenced by the
+    compiled methods (dcc --resolve-table), and of their string constants
+    (dcc --string-pool).
+
+    Each distinct reference gets a dense id shared by all the methods, the
+    runtime resolves it once into d2c_resolved_ids[id]. The code of a method
+    refers to the local ids D2C_ID_<n> of its references, defined by
+    :meth:`get_defines`. When `obfus` is set, the string constants are
+    obfuscated in d2c_get_string_constant instead of being stored in the
+    table.
+    """
+
+    def __init__(self, obfus=False):
+        self.obfus = obfus
+        self.ids = {}
+        # (kind, class id, name, signature) of each id
+        self.entries = []
+
+    def get_id(self, ref):
+        ref = tuple(ref)
+        if ref not in self.ids:
+            if ref[0] in ('CLASS', 'STRING'):
+                entry = (ref[0], -1, ref[1], None)
+            else:
+                entry = (ref[0], self.get_id(('CLASS', ref[1])), ref[2], ref[3])
+            self.ids[ref] = len(self.entries)
+            self.entries.append(entry)
+        return self.ids[ref]
+
+    def get_defines(self, refs):
+        return ''.join('#define D2C_ID_%d %d\n' % (i, self.get_id(ref)) for i, ref in enumerate(refs))
+
+    def get_source(self):
+        lines = ['#include "Dex2C.h"\n\n']
+        # An array can not be empty
+        size = max(len(self.entries), 1)
+        lines.append('const D2CTableEntry d2c_resolve_entries[%d] = {\n' % size)
+        obfuscated = []
+        for entry_id, (kind, class_id, name, signature) in enumerate(self.entries):
+            if kind == 'STRING' and self.obfus:
+                obfuscated.append((entry_id, name))
+                name = None
+            lines.append('    {D2C_TABLE_%s, %d, %s, %s},\n' % (
+                kind, class_id, '"%s"' % name if name is not None else 'NULL',
+                '"%s"' % signature if signature is not None else 'NULL'))
+        lines.append('};\n\n')
+        lines.append('void *d2c_resolved_ids[%d];\n\n' % size)
+        lines.append('const char *d2c_get_string_constant(int id) {\n')
+        if obfuscated:
+            lines.append('    switch (id) {\n')
+            for entry_id, name in obfuscated:
+                lines.append('        case %d: return AY_OBFUSCATE("%s");\n' % (entry_id, name))
+            lines.append('    }\n')
+        lines.append('    return d2c_resolve_entries[id].name;\n')
+        lines.append('}\n')
+        return ''.join(lines)
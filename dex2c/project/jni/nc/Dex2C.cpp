@@ -259,6 +259,164 @@ bool d2c_resolve_field(JNIEnv *env, jclass *cached_class, jfieldID *cached_field
     return *cached_field == NULL;
 }
 
+// The first resolution wins, a shared cache never changes once published.
+// Returns false if another thread published it first.
+template<typename T>
+static bool d2c_publish_id(T *cached_id, T id) {
+    T expected = NULL;
+    return __atomic_compare_exchange_n(cached_id, &expected, id, false, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE);
+}
+
+bool d2c_resolve_shared_class(JNIEnv *env, jclass *cached_class, const char *class_name) {
+    if (d2c_load_id(cached_class)) {
+        return false;
+    }
+
+    MemberTriple triple(class_name, NULL, NULL);
+    jclass clz = NULL;
+    {
+        ScopedPthreadMutexLock lock(&resovle_class_mutex);
+
+        auto iter = resvoled_classes.find(triple);
+        if (iter != resvoled_classes.end()) {
+            clz = iter->second;
+        }
+    }
+
+    if (clz == NULL) {
+        // Not limited by max_global_reference: the cache outlives the local frame
+        ScopedLocalRef<jclass> local_clz(env, env->FindClass(class_name));
+        if (local_clz.get() == NULL) {
+            return true;
+        }
+        LOGD("resvoled shared class %s", class_name);
+        ScopedPthreadMutexLock lock(&resovle_class_mutex);
+        auto iter = resvoled_classes.find(triple);
+        if (iter != resvoled_classes.end()) {
+            clz = iter->second;
+        } else {
+            clz = (jclass) env->NewGlobalRef(local_clz.get());
+            resvoled_classes[triple] = clz;
+        }
+    }
+
+    d2c_publish_id(cached_class, clz);
+    return false;
+}
+
+bool d2c_resolve_shared_method(JNIEnv *env, jclass *cached_class, jmethodID *cached_method, bool is_static,
+                               const char *class_name, const char *method_name, const char *signature) {
+    if (d2c_load_id(cached_method)) {
+        return false;
+    }
+
+    if (d2c_resolve_shared_class(env, cached_class, class_name)) {
+        return true;
+    }
+
+    // The class is published before the method, a thread seeing the method sees the class
+    jclass clz = d2c_load_id(cached_class);
+    jmethodID mid = NULL;
+    if (d2c_resolve_method(env, &clz, &mid, is_static, class_name, method_name, signature)) {
+        return true;
+    }
+
+    d2c_publish_id(cached_method, mid);
+    return false;
+}
+
+bool d2c_resolve_shared_field(JNIEnv *env, jclass *cached_class, jfieldID *cached_field, bool is_static,
+                              const char *class_name, const char *field_name, const char *signature) {
+    if (d2c_load_id(cached_field)) {
+        return false;
+    }
+
+    if (d2c_resolve_shared_class(env, cached_class, class_name)) {
+        return true;
+    }
+
+    jclass clz = d2c_load_id(cached_class);
+    jfieldID fid = NULL;
+    if (d2c_resolve_field(env, &clz, &fid, is_static, class_name, field_name, signature)) {
+        return true;
+    }
+
+    d2c_publish_id(cached_field, fid);
+    return false;
+}
+
+bool d2c_is_instance_of_shared(JNIEnv *env, jobject instance, jclass *cached_class, const char *class_name) {
+    if (instance == NULL) {
+        return false;
+    }
+
+    if (d2c_load_id(cached_class) == NULL && d2c_resolve_shared_class(env, cached_class, class_name)) {
+        // Do not replace the exception being dispatched
+        env->ExceptionClear();
+        return false;
+    }
+    return env->IsInstanceOf(instance, d2c_load_id(cached_class));
+}
+
+void *d2c_resolve_table_id(JNIEnv *env, int id) {
+    void *resolved = d2c_load_id(&d2c_resolved_ids[id]);
+    if (resolved) {
+        return resolved;
+    }
+
+    const D2CTableEntry &entry = d2c_resolve_entries[id];
+    if (entry.kind == D2C_TABLE_STRING) {
+        ScopedLocalRef<jstring> string(env, env->NewStringUTF(d2c_get_string_constant(id)));
+        if (string.get() == NULL) {
+            return NULL;
+        }
+        // The strings of const-string are interned by the VM
+        ScopedLocalRef<jobject> interned(env, env->CallObjectMethod(string.get(),
+                                                                    d2c::WellKnownClasses::java_lang_String_intern));
+        if (interned.get() == NULL) {
+            return NULL;
+        }
+        resolved = env->NewGlobalRef(interned.get());
+        if (!d2c_publish_id(&d2c_resolved_ids[id], resolved)) {
+            env->DeleteGlobalRef((jobject) resolved);
+        }
+        return d2c_load_id(&d2c_resolved_ids[id]);
+    } else if (entry.kind == D2C_TABLE_CLASS) {
+        jclass clz = NULL;
+        if (d2c_resolve_shared_class(env, &clz, entry.name)) {
+            return NULL;
+        }
+        resolved = clz;
+    } else {
+        // The class is published before its members
+        jclass clz = (jclass) d2c_resolve_table_id(env, entry.class_id);
+        if (clz == NULL) {
+            return NULL;
+        }
+        switch (entry.kind) {
+            case D2C_TABLE_METHOD:
+                resolved = env->GetMethodID(clz, entry.name, entry.signature);
+                break;
+            case D2C_TABLE_STATIC_METHOD:
+                resolved = env->GetStaticMethodID(clz, entry.name, entry.signature);
+                break;
+            case D2C_TABLE_FIELD:
+                resolved = env->GetFieldID(clz, entry.name, entry.signature);
+                break;
+            default:
+                resolved = env->GetStaticFieldID(clz, entry.name, entry.signature);
+                break;
+        }
+        if (resolved == NULL) {
+            return NULL;
+        }
+        LOGD("resvoled table id %d %s%s", id, entry.name, entry.signature);
+    }
+
+    d2c_publish_id(&d2c_resolved_ids[id], resolved);
+    return d2c_load_id(&d2c_resolved_ids[id]);
+}
+
 JNIEXPORT jint JNI_OnLoad(JavaVM *vm, void *reserved) {
     JNIEnv *env;
 
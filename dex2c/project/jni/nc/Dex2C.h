@@ -35,6 +35,55 @@
     goto EX_HANDLE;                                                                                                         \
   }
 
+/*
+ * The D2C_RESOLVE_SHARED_* macros resolve the IDs cached in static storage
+ * (dcc --static-ids), shared by all the calls of a method and by the threads.
+ * A cache is published once with release semantics and read with acquire
+ * semantics, so after the first call the resolution is a single load. The
+ * shared classes are always global references.
+ */
+#define D2C_RESOLVE_SHARED_CLASS(cached_class, class_name)                   \
+  if (d2c_load_id(&cached_class) == NULL && d2c_resolve_shared_class(env, &cached_class, class_name)) {              \
+    goto EX_HANDLE;                                                            \
+  }
+
+#define D2C_RESOLVE_SHARED_METHOD(cached_class, cached_method, class_name, method_name, signature)                      \
+    if (d2c_load_id(&cached_method) == NULL && d2c_resolve_shared_method(env, &cached_class, &cached_method, false, class_name, method_name, signature)) { \
+        goto EX_HANDLE;                                                                                                     \
+    }
+
+#define D2C_RESOLVE_SHARED_STATIC_METHOD(cached_class, cached_method, class_name, method_name, signature)               \
+    if (d2c_load_id(&cached_method) == NULL && d2c_resolve_shared_method(env, &cached_class, &cached_method, true, class_name, method_name, signature)) { \
+        goto EX_HANDLE;                                                                                                     \
+    }
+
+#define D2C_RESOLVE_SHARED_FIELD(cached_class, cached_field, class_name, field_name, signature)                        \
+  if (d2c_load_id(&cached_field) == NULL && d2c_resolve_shared_field(env, &cached_class, &cached_field, false, class_name, field_name, signature)) { \
+    goto EX_HANDLE;                                                                                                         \
+  }
+
+#define D2C_RESOLVE_SHARED_STATIC_FIELD(cached_class, cached_field, class_name, field_name, signature)                 \
+  if (d2c_load_id(&cached_field) == NULL && d2c_resolve_shared_field(env, &cached_class, &cached_field, true, class_name, field_name, signature)) { \
+    goto EX_HANDLE;                                                                                                         \
+  }
+
+/*
+ * The D2C_RESOLVE_TABLE_* macros resolve the IDs through the global table
+ * written by dcc --resolve-table (ResolveTable.cpp). Each class, method and
+ * field has a dense id, its ID is resolved once into d2c_resolved_ids[id]
+ * and then read with a single acquire load, without lock nor lookup.
+ */
+#define D2C_RESOLVE_TABLE_CLASS(cached_class, class_id)                      \
+  if (cached_class == NULL && d2c_get_table_id(env, class_id, &cached_class)) { \
+    goto EX_HANDLE;                                                            \
+  }
+
+#define D2C_RESOLVE_TABLE_MEMBER(cached_class, cached_member, class_id, member_id)                                    \
+  if (cached_member == NULL && (d2c_get_table_id(env, member_id, &cached_member) ||                                 \
+                                d2c_get_table_id(env, class_id, &cached_class))) {                                  \
+    goto EX_HANDLE;                                                                                                 \
+  }
+
 #define D2C_CHECK_PENDING_EX                                                   \
   if (env->ExceptionCheck()) {                                                 \
     goto EX_HANDLE;                                                            \
@@ -67,6 +116,61 @@
 #define LOGD(...) (0)
 #endif
 
+template<typename T>
+inline T d2c_load_id(T *cached_id) {
+    return __atomic_load_n(cached_id, __ATOMIC_ACQUIRE);
+}
+
+enum D2CTableKind {
+    D2C_TABLE_CLASS,
+    D2C_TABLE_METHOD,
+    D2C_TABLE_STATIC_METHOD,
+    D2C_TABLE_FIELD,
+    D2C_TABLE_STATIC_FIELD,
+    D2C_TABLE_STRING,
+};
+
+struct D2CTableEntry {
+    D2CTableKind kind;
+    int class_id;  // id of the class of a method or a field
+    const char *name;  // name of the class, of the method or of the field, or the string
+    const char *signature;
+};
+
+extern const D2CTableEntry d2c_resolve_entries[];
+
+extern void *d2c_resolved_ids[];
+
+/* Returns the string of the entry `id` of kind D2C_TABLE_STRING */
+const char *d2c_get_string_constant(int id);
+
+/* Returns the ID of the entry `id`, or NULL if an exception occurred */
+void *d2c_resolve_table_id(JNIEnv *env, int id);
+
+/* Returns true if exception occurred */
+template<typename T>
+inline bool d2c_get_table_id(JNIEnv *env, int id, T *cached_id) {
+    void *resolved = d2c_load_id(&d2c_resolved_ids[id]);
+    if (resolved == NULL && (resolved = d2c_resolve_table_id(env, id)) == NULL) {
+        return true;
+    }
+    *cached_id = (T) resolved;
+    return false;
+}
+
+/*
+ * Returns a new local reference to the string constant `id` of the pool
+ * (dcc --string-pool), or NULL if an exception occurred. The string is
+ * created and interned once, then kept as a global reference.
+ */
+inline jstring d2c_get_pool_string(JNIEnv *env, int id) {
+    void *string = d2c_load_id(&d2c_resolved_ids[id]);
+    if (string == NULL && (string = d2c_resolve_table_id(env, id)) == NULL) {
+        return NULL;
+    }
+    return (jstring) env->NewLocalRef((jobject) string);
+}
+
 inline jdouble d2c_bitcast_to_double(uint64_t val) {
     union {
         double dest;
@@ -85,6 +189,48 @@ inline jfloat d2c_bitcast_to_float(uint32_t val) {
     return conv.dest;
 }
 
+/* The intrinsics of the methods of java.lang.Math, Float, Double and String */
+inline int32_t d2c_abs_int(int32_t val) {
+    return val < 0 ? static_cast<int32_t>(0u - static_cast<uint32_t>(val)) : val;
+}
+
+inline int64_t d2c_abs_long(int64_t val) {
+    return val < 0 ? static_cast<int64_t>(0ull - static_cast<uint64_t>(val)) : val;
+}
+
+inline int32_t d2c_float_to_raw_int_bits(float val) {
+    union {
+        float src;
+        int32_t dest;
+    } conv;
+    conv.src = val;
+    return conv.dest;
+}
+
+inline int32_t d2c_float_to_int_bits(float val) {
+    return val != val ? 0x7fc00000 : d2c_float_to_raw_int_bits(val);
+}
+
+inline int64_t d2c_double_to_raw_long_bits(double val) {
+    union {
+        double src;
+        int64_t dest;
+    } conv;
+    conv.src = val;
+    return conv.dest;
+}
+
+inline int64_t d2c_double_to_long_bits(double val) {
+    return val != val ? 0x7ff8000000000000ll : d2c_double_to_raw_long_bits(val);
+}
+
+/* GetStringRegion throws the StringIndexOutOfBoundsException of charAt */
+inline jchar d2c_string_char_at(JNIEnv *env, jstring string, jint index) {
+    jchar c = 0;
+    env->GetStringRegion(string, index, 1, &c);
+    return c;
+}
+
 inline double d2c_long_to_double(int64_t l) {
     return static_cast<double>(l);
 }
@@ -115,6 +261,13 @@ inline bool d2c_is_instance_of(JNIEnv *env, jobject instance, jclass clz) {
 
 bool d2c_is_instance_of(JNIEnv *env, jobject instance, const char *class_name);
 
+/*
+ * Like d2c_is_instance_of with a class name, the class is resolved once into
+ * `cached_class`, a cache in static storage. A class which can not be loaded
+ * matches nothing.
+ */
+bool d2c_is_instance_of_shared(JNIEnv *env, jobject instance, jclass *cached_class, const char *class_name);
+
 inline bool d2c_is_same_object(JNIEnv *env, jobject obj1, jobject obj2) {
     if (obj1 == obj2) {
         return true;
@@ -137,4 +290,12 @@ bool d2c_resolve_method(JNIEnv *env, jclass *cached_class, jmethodID *cached_met
 bool d2c_resolve_field(JNIEnv *env, jclass *cached_class, jfieldID *cached_field, bool is_static,
                        const char *class_name, const char *field_name, const char *signature);
 
+bool d2c_resolve_shared_class(JNIEnv *env, jclass *cached_class, const char *class_name);
+
+bool d2c_resolve_shared_method(JNIEnv *env, jclass *cached_class, jmethodID *cached_method, bool is_static,
+                               const char *class_name, const char *method_name, const char *signature);
+
+bool d2c_resolve_shared_field(JNIEnv *env, jclass *cached_class, jfieldID *cached_field, bool is_static,
+                              const char *class_name, const char *field_name, const char *signature);
+
 #endif
@@ -18,6 +18,9 @@ jclass WellKnownClasses::java_lang_Short;
 jclass WellKnownClasses::java_lang_Character;
 jclass WellKnownClasses::java_lang_Byte;
 jclass WellKnownClasses::java_lang_Boolean;
+jclass WellKnownClasses::java_lang_String;
+
+jmethodID WellKnownClasses::java_lang_String_intern;
 
 jclass WellKnownClasses::primitive_double;
 jclass WellKnownClasses::primitive_float;
@@ -71,6 +74,9 @@ void WellKnownClasses::Init(JNIEnv* env) {
     java_lang_Character = CacheClass(env, "java/lang/Character");
     java_lang_Byte = CacheClass(env, "java/lang/Byte");
     java_lang_Boolean = CacheClass(env, "java/lang/Boolean");
+    java_lang_String = CacheClass(env, "java/lang/String");
+
+    java_lang_String_intern = CacheMethod(env, java_lang_String, false, "intern", "()Ljava/lang/String;");
 
     primitive_double = static_cast<jclass>(CachePrimitiveClass(env, java_lang_Double, "TYPE",
                                                                "Ljava/lang/Class;"));
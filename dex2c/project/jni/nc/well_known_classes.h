@@ -26,6 +26,9 @@ struct WellKnownClasses {
   static jclass java_lang_Character;
   static jclass java_lang_Byte;
   static jclass java_lang_Boolean;
+  static jclass java_lang_String;
+
+  static jmethodID java_lang_String_intern;
 
   static jclass primitive_double;
   static jclass primitive_float;